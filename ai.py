@@ -0,0 +1,207 @@
+"""
+Move advisor: expectimax over the next dice rolls.
+
+Decision nodes choose a (pair, circle) for the current roll, chance
+nodes average over the distinct pair values of the 36 rolls. Scores are
+the ScoreMap and ScorePath totals; the last decision before the search
+horizon uses the immediate map gain of each move, computed without
+copying the board.
+"""
+
+import random
+import time
+from collections import Counter, OrderedDict
+
+import model
+import sim
+
+
+# distinct pair values of all rolls, with their probability
+OUTCOMES = tuple((values, count/36) for values, count in
+                 Counter(values for row in model.PAIR_TABLE for values in row).items())
+
+# all values a circle can get
+VALUES = sorted({ value for values, _ in OUTCOMES for value in values })
+
+
+class Timeout(Exception):
+    pass
+
+
+class Advisor:
+    def __init__(self, budget=0.05, max_depth=8, table_size=100000, seed=0):
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table_size = table_size
+        # chance node values, by (hash, depth), for the paths of self.paths
+        self.table = OrderedDict()
+        self.paths = None
+        self.zobrist = None
+        self.rng = random.Random(seed)
+        # statistics
+        self.nodes = 0
+        self.elapsed = 0.
+        self.hits = 0
+        self.misses = 0
+        self.depth = 0
+
+    def nodes_per_second(self):
+        return self.nodes/self.elapsed if self.elapsed else 0.
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits/total if total else 0.
+
+    def init_zobrist(self, count):
+        bits = lambda: self.rng.getrandbits(64)
+        self.zobrist = (
+            [ { value: bits() for value in VALUES } for _ in range(count) ],
+            [ [ bits() for _ in range(16) ] for _ in model.Pair ],
+        )
+
+    def hash(self, state):
+        circles, choices = self.zobrist
+        key = 0
+        for num, value in enumerate(state.values):
+            if value != sim.EMPTY:
+                key ^= circles[num][value]
+        for pair in model.Pair:
+            key ^= choices[pair][state.count(pair)]
+        return key
+
+    def child(self, state, key, pair, num):
+        circles, choices = self.zobrist
+        count = state.count(pair)
+        child = state.copy()
+        child.place(pair, num)
+        key ^= circles[num][child.values[num]]
+        key ^= choices[pair][count] ^ choices[pair][count+1]
+        return child, key
+
+    def evaluate(self, state):
+        return state.map_score()[2] + state.path_score()[2]
+
+    def gain(self, state, value, num):
+        """Map score change if value is placed in circle num."""
+        roots = { state.find(other) for other in state.neighbours[num]
+                                    if state.values[other] == value }
+        size = 1
+        points = 0
+        for root in roots:
+            size += state.size[root]
+            if state.size[root] >= 2:
+                points -= value+state.size[root]-1
+        if size < 2:
+            return 0
+        points += value+size-1
+        return points + state.bonus[max(state.max_size, size)] - state.bonus[state.max_size]
+
+    def check_time(self):
+        if time.perf_counter() > self.deadline:
+            raise Timeout()
+
+    def chance(self, state, key, depth):
+        """Expected score of a state before the dice roll."""
+        if depth == 0 or state.done():
+            self.nodes += 1
+            return self.evaluate(state)
+        entry = (key, depth)
+        value = self.table.get(entry)
+        if value is not None:
+            self.hits += 1
+            self.table.move_to_end(entry)
+            return value
+        self.misses += 1
+        self.check_time()
+        if depth == 1:
+            value = self.horizon(state)
+        else:
+            value = 0.
+            for values, probability in OUTCOMES:
+                state.pairs = values
+                value += probability*self.decide(state, key, depth)[0]
+        self.table[entry] = value
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+        return value
+
+    def horizon(self, state):
+        """Expected score after one more move chosen by its immediate gain."""
+        best = {}
+        for value in VALUES:
+            best[value] = max(self.gain(state, value, num) for num in state.empty)
+        self.nodes += len(VALUES)*len(state.empty)
+        expected = 0.
+        for values, probability in OUTCOMES:
+            expected += probability*max(best[values[pair]] for pair in state.open_pairs)
+        return self.evaluate(state) + expected
+
+    def ordered_moves(self, state):
+        """Legal moves, best immediate gain first."""
+        moves = state.legal_moves()
+        gains = { move: self.gain(state, state.pairs[move[0]], move[1]) for move in moves }
+        return sorted(moves, key=lambda move: -gains[move])
+
+    def decide(self, state, key, depth):
+        """Best (value, move) for the current roll."""
+        best = (float('-inf'), None)
+        for pair, num in self.ordered_moves(state):
+            self.check_time()
+            child, child_key = self.child(state, key, pair, num)
+            value = self.chance(child, child_key, depth-1)
+            if value > best[0]:
+                best = (value, (pair, num))
+        return best
+
+    def best(self, state):
+        """Best (pair, circle) for the roll of a sim.Sim state."""
+        start = time.perf_counter()
+        # keep a margin for the node running when time is over
+        self.deadline = start + 0.9*self.budget
+        if self.zobrist is None:
+            self.init_zobrist(len(state.values))
+        # the search does not link circles, but the path score of table
+        # entries is stale once paths changed between two moves
+        paths = [ state.path_find(num) for num in range(len(state.values)) ]
+        if paths != self.paths:
+            self.table.clear()
+            self.paths = paths
+        key = self.hash(state)
+        moves = self.ordered_moves(state)
+        if not moves:
+            return None
+        move = moves[0]
+        self.depth = 0
+        try:
+            for depth in range(1, self.max_depth+1):
+                # iterative deepening, previous best move searched first
+                scores = []
+                try:
+                    for pair, num in moves:
+                        if depth > 1:
+                            self.check_time()
+                        child, child_key = self.child(state, key, pair, num)
+                        scores.append((self.chance(child, child_key, depth-1), (pair, num)))
+                finally:
+                    # a partial search is kept, it always includes the previous best move
+                    if scores:
+                        move = max(scores, key=lambda score: score[0])[1]
+                        self.depth = depth
+                moves = [ move for _, move in sorted(scores, key=lambda score: -score[0]) ] + \
+                        moves[len(scores):]
+                if depth-1 > len(state.empty):
+                    break
+        except Timeout:
+            pass
+        self.elapsed += time.perf_counter() - start
+        return move
+
+    def advise(self, game):
+        """Best (pair, circle) for the current roll of a model.Game."""
+        return self.best(sim.Sim.from_game(game))
+
+    def play(self, game):
+        pair, num = self.advise(game)
+        game.check(pair)
+        game.choose(num)
+        return pair, num
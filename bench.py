@@ -0,0 +1,564 @@
+#!/usr/bin/env python
+"""
+Benchmarks, run all or some of them with:
+    python bench.py [name ...]
+"""
+
+import os
+import random
+import subprocess
+import sys
+import time
+
+from tests.helpers import IMPORT_BUDGET, IMPORT_CHECK, collide_hits, lattice, play_game, \
+                          random_actions, random_boards, random_clicks, record_games, \
+                          reference_map_score
+
+
+def best_time(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def bench_connections(sizes=(19, 1000, 100000), loop_max=2000):
+    import builder
+    print('circles   loop (s)         numpy (s)   csr (s)     speedup')
+    for n in sizes:
+        circles = lattice(n)
+        fast, _ = best_time(builder.get_connections_fast, circles)
+        csr, _ = best_time(builder.get_connections_fast, circles, True)
+        if n <= loop_max:
+            loop, _ = best_time(builder.get_connections, circles, repeat=1)
+            loop_text = f'{loop:<16.6f}'
+        else:
+            # quadratic loop, extrapolate from a sample
+            sample, _ = best_time(builder.get_connections, circles[:loop_max], repeat=1)
+            loop = sample*(n/loop_max)**2
+            loop_text = f'{loop:<10.1f} est. '
+        print(f'{n:<9} {loop_text} {fast:<11.6f} {csr:<11.6f} {loop/fast:.0f}x')
+
+
+DETECT = """
+import resource, sys, time
+import builder
+import cv2
+filename, scaled, scale = sys.argv[1], sys.argv[2] == 'scaled', float(sys.argv[3])
+start = time.perf_counter()
+if scaled:
+    circles = builder.get_circles_scaled(filename)
+else:
+    circles = builder.get_circles(filename, builder.scale_hough(builder.HOUGH, scale))
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, peak, len(circles or ()))
+"""
+
+def bench_detect(scales=(1, 2, 4, 8)):
+    """
+    Full image Hough against scaled down and cropped Hough, on enlarged
+    board images: time, process peak memory and circles found.
+    """
+    import tempfile
+    import cv2
+    image = cv2.imread('dunai.jpg')
+    print(f'{"size":>11} {"full s":>8} {"MB":>6} {"n":>3} {"scaled s":>9} {"MB":>6} {"n":>3}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            filename = os.path.join(tmp, f'board{scale}.png')
+            big = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            cv2.imwrite(filename, big)
+            results = []
+            for method in ('full', 'scaled'):
+                output = subprocess.run([sys.executable, '-c', DETECT, filename, method, str(scale)],
+                                        capture_output=True, text=True, check=True).stdout
+                elapsed, peak, count = output.split()
+                results.append(f'{float(elapsed):8.3f} {int(peak)/1024:6.1f} {count:>3}')
+            print(f'{big.shape[1]:5}x{big.shape[0]:<5} ' + ' '.join(results))
+
+
+def bench_import(budget=IMPORT_BUDGET, repeat=5):
+    """Import time of model, tests/test_import.py checks it."""
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT_CHECK], check=True,
+                             capture_output=True, text=True).stdout
+        elapsed, heavy, _, _ = out.splitlines()[-1].split('|')
+        times.append(float(elapsed))
+    best = min(times)
+    print(f'import model: {best*1000:.2f} ms (budget {budget*1000:.0f} ms), '
+          f'heavy modules: {heavy or "none"}')
+
+
+def bench_scoremap(count=5000):
+    """
+    Disjoint-set ScoreMap against the previous algorithm on random boards,
+    tests/test_scoremap.py checks they score the same.
+    """
+    import builder
+    board = builder.get_board()
+    maps = list(random_boards(board, count))
+    fast, _ = best_time(lambda: [ score_map.score() for score_map in maps ])
+    loop, _ = best_time(lambda: [ reference_map_score(score_map) for score_map in maps ])
+    print(f'{count} random boards, score: {fast/count*1e6:.2f} us, previous: {loop/count*1e6:.2f} us')
+
+def reference_group(circles, num):
+    """Circles connected to num with the same value, by breadth first search."""
+    value = circles[num].value
+    group = { num }
+    todo = [ num ]
+    while todo:
+        for other in circles[todo.pop()].cnxs:
+            if other not in group and circles[other].value == value:
+                group.add(other)
+                todo.append(other)
+    return group
+
+def bench_bitboard(count=2000):
+    """Bit board mapping test and flood fill against the neighbour loops."""
+    import builder
+    import model
+    board = builder.get_board()
+    boards = [ score_map.circles for score_map in random_boards(board, count, seed=1) ]
+    for circles in boards:
+        for circle in circles.circles:
+            if circle.value is None:
+                continue
+            assert set(model.bits(circles.group(circle.num))) == reference_group(circles, circle.num)
+            assert set(model.bits(circles.same(circle.num, circle.value))) == \
+                   { other for other in circle.cnxs if circles[other].value == circle.value }
+    loop = lambda: [ [ other for other in circle.cnxs if circles[other].value == circle.value ]
+                     for circles in boards for circle in circles.circles ]
+    mask = lambda: [ circles.same(num, value) for circles in boards
+                     for num, value in enumerate(circles.values) ]
+    calls = count*len(boards[0].circles)
+    fast, _ = best_time(mask)
+    slow, _ = best_time(loop)
+    print(f'mapping test: {fast/calls*1e9:.0f} ns, neighbour loop: {slow/calls*1e9:.0f} ns')
+    fast, _ = best_time(lambda: [ circles.group(0) for circles in boards ])
+    slow, _ = best_time(lambda: [ reference_group(circles, 0) for circles in boards ])
+    print(f'flood fill: {fast/count*1e6:.2f} us, search: {slow/count*1e6:.2f} us')
+
+
+
+def bench_render(turns=200):
+    """Dirty rectangles pushed per action under the SDL dummy driver."""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import ihm
+    import model
+    pygame.init()
+    window = ihm.Window(model.Game())
+    for pos in random_clicks(window, turns):
+        event = pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1)
+        window.handle(event)
+    stats = ihm.screen.stats()
+    full = window.size[0]*window.size[1]
+    print(f'{stats["frames"]} frames, {stats["pixels_per_frame"]:.0f} pixels per frame '
+          f'({stats["pixels_per_frame"]/full:.1%} of a flip), '
+          f'mean frame time {stats["mean_frame_time"]*1000:.2f} ms, '
+          f'last draw time {stats["draw_time"]*1000:.3f} ms, '
+          f'surface cache hit rate {stats["cache_hit_rate"]:.1%}')
+    pygame.quit()
+
+def bench_instrument(games=200, turns=200):
+    """Counters overhead on model games, and counters of a played window."""
+    import tempfile
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import builder
+    import ihm
+    import instrument
+    import model
+    board = builder.get_board()
+    originals = dict(vars(model.EventSource))
+    def play():
+        scores = []
+        for seed in range(games):
+            # dices use the random module
+            random.seed(seed)
+            scores.append(play_game(model.Game(board), random.Random(seed)))
+        return scores
+    disabled, scores = best_time(play)
+    instrument.enable()
+    enabled, instrumented = best_time(play)
+    instrument.disable()
+    assert instrumented == scores and dict(vars(model.EventSource)) == originals
+    print(f'{games} games: {disabled/games*1000:.2f} ms, instrumented {enabled/games*1000:.2f} ms')
+    instrument.reset()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'counters.jsonl')
+        instrument.enable(ui=True, dump=filename, interval=0.05)
+        pygame.init()
+        window = ihm.Window(model.Game(board))
+        for pos in random_clicks(window, turns):
+            window.handle(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1))
+        instrument.disable()
+        pygame.quit()
+        with open(filename) as f:
+            lines = f.readlines()
+    instrument.report()
+    print(f'{len(lines)} dump lines')
+    instrument.reset()
+
+def bench_library(images=1000, invalid=10):
+    """Board library built from shifted copies of the board image, and board loads by id."""
+    import tempfile
+    import cv2
+    import numpy as np
+    import builder
+    import library
+    import model
+    image = cv2.imread('dunai.jpg')
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        shifts = {}
+        for i in range(images):
+            if i < invalid:
+                copy = np.full_like(image, 255)
+            else:
+                dx, dy = rng.randint(-8, 8), rng.randint(-8, 8)
+                shifts[f'board{i:04}'] = dx, dy
+                matrix = np.float32([[1, 0, dx], [0, 1, dy]])
+                copy = cv2.warpAffine(image, matrix, image.shape[1::-1], borderMode=cv2.BORDER_REPLICATE)
+            cv2.imwrite(os.path.join(tmp, f'board{i:04}.png'), copy)
+        filename = os.path.join(tmp, 'boards.lib')
+        start = time.perf_counter()
+        errors = library.build(tmp, filename, count=19)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        boards = library.Library(filename)
+        opened = time.perf_counter() - start
+        assert len(boards) + len(errors) == images
+        circles, cnxs = builder.get_board()
+        for board_id in rng.sample(boards.ids(), 20):
+            dx, dy = shifts[board_id]
+            moved, moved_cnxs = boards.get(board_id)
+            # same circles up to a few pixels, in Hough order
+            same = [ min(range(len(circles)), key=lambda i: abs(x-dx-circles[i][0]) + abs(y-dy-circles[i][1]))
+                     for x, y, _ in moved ]
+            for (x, y, _), i in zip(moved, same):
+                assert abs(x-dx-circles[i][0]) + abs(y-dy-circles[i][1]) <= 6
+            assert sorted((same[i], same[j]) for i, j in moved_cnxs) == sorted(cnxs)
+        board_ids = boards.ids()
+        load, _ = best_time(lambda: [ boards.get(board_id) for board_id in board_ids ], repeat=1)
+        default, library.LIBRARY = library.LIBRARY, filename
+        try:
+            for board_id in board_ids[:10]:
+                assert model.Circles(board_id).geometry == boards.get(board_id)[0]
+            game, _ = best_time(lambda: [ model.Circles(board_id) for board_id in board_ids[:100] ])
+        finally:
+            library.LIBRARY = default
+            del library.libraries[os.path.abspath(filename)]
+        size = os.path.getsize(filename)
+        boards.map.close()
+    print(f'{images} images in {elapsed:.1f} s ({images/elapsed:.1f} images/s, '
+          f'{os.cpu_count()} workers), {len(errors)} rejected, {size} bytes')
+    print(f'open {opened*1000:.2f} ms, first load {load/images*1e6:.1f} us, '
+          f'model.Circles {game/100*1e6:.1f} us')
+
+
+def bench_sim(games=2000):
+    """Games per second of the headless engine against model.Game."""
+    import builder
+    import model
+    import sim
+    board = builder.get_board()
+    rng = random.Random(0)
+    for _ in range(200):
+        game = model.Game(board)
+        engine = sim.Sim(board)
+        play_game(game, rng, engine)
+        assert game.score_maps.score() == engine.map_score()
+        assert game.score_path.score() == engine.path_score()
+    print('200 mirrored games score the same')
+    engine = sim.Sim(board)
+    elapsed, _ = best_time(lambda: [ sim.play(engine, rng) for _ in range(games) ], repeat=1)
+    fast = games/elapsed
+    elapsed, _ = best_time(lambda: [ play_game(model.Game(board), rng) for _ in range(games//10) ], repeat=1)
+    slow = games//10/elapsed
+    print(f'sim: {fast:.0f} games/s, model.Game: {slow:.0f} games/s ({fast/slow:.1f}x)')
+
+
+def bench_dice(count=1000000):
+    """Batched numpy rolls against Dices.throw and Dices.pairing."""
+    import numpy as np
+    import model
+    import sim
+    generator = np.random.default_rng(0)
+    fast, (red, yellow, values) = best_time(sim.throw_batch, count, generator)
+    for i in range(0, count, count//1000):
+        assert tuple(values[i]) == model.pair_values(int(red[i]), int(yellow[i]))
+    dices = model.Dices()
+    def loop(n):
+        for _ in range(n):
+            dices.throw()
+            dices.pairing()
+    slow, _ = best_time(loop, count//100)
+    slow *= 100
+    print(f'{count} rolls: throw_batch {fast:.3f} s, Dices {slow:.3f} s ({slow/fast:.0f}x)')
+
+
+def bench_ai(games=10):
+    """Advisor score, latency per move, nodes per second and table hit rate."""
+    import ai
+    import model
+    import sim
+    advisor = ai.Advisor()
+    scores = []
+    latencies = []
+    for seed in range(games):
+        engine = sim.Sim(seed=seed)
+        engine.throw()
+        while not engine.done():
+            start = time.perf_counter()
+            move = advisor.best(engine)
+            latencies.append(time.perf_counter() - start)
+            engine.step(*move)
+        scores.append(engine.map_score()[2])
+    # advisor on the object model
+    game = model.Game()
+    pair, num = advisor.play(game)
+    assert game.circles[num].value == game.dices.value(pair)
+    latencies.sort()
+    print(f'{games} games, mean map score {sum(scores)/games:.1f}')
+    print(f'latency p50 {latencies[len(latencies)//2]*1000:.1f} ms, '
+          f'max {latencies[-1]*1000:.1f} ms (budget {advisor.budget*1000:.0f} ms)')
+    print(f'{advisor.nodes_per_second():.0f} nodes/s, table hit rate {advisor.hit_rate():.1%}')
+
+
+def drive(board, moves):
+    """model.Game driven by the records of a game log."""
+    import gamelog
+    import model
+    game = model.Game(board)
+    for op, arg, arg2 in moves:
+        if op == gamelog.TURN:
+            game.dices.red.value = arg
+            game.dices.yellow.value = arg2
+            game.value = None
+            game.circle = None
+        elif op == gamelog.CHECK:
+            game.check(arg)
+        elif op == gamelog.CHOOSE:
+            game.choose(arg)
+    return game
+
+def bench_gamelog(games=1000):
+    """Replay of a game log against model.Game driven by the same records."""
+    import tempfile
+    import builder
+    import gamelog
+    board = builder.get_board()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'games.log')
+        record_games(filename, board, games)
+        log = gamelog.GameLog(filename, board)
+        print(f'{games} games, {len(log)} records, {os.path.getsize(filename)} bytes')
+        elapsed, _ = best_time(lambda: [ (state.map_score(), state.path_score())
+                                         for _, state in log.replay() ])
+        moves = [ log.moves(game) for game in range(games//10) ]
+        driven, _ = best_time(lambda: [ drive(board, game_moves) for game_moves in moves ])
+        driven *= 10
+        seek, _ = best_time(lambda: [ log.seek(game, 35) for game in range(games//10) ])
+        log.close()
+    print(f'replay {games/elapsed:.0f} games/s, model.Game {games/driven:.0f} games/s '
+          f'({driven/elapsed:.1f}x), seek {seek/(games//10)*1e6:.1f} us')
+
+# bytes per instance measured like bench_memory at abe10fc, before the
+# byte arrays: Circle objects with their own dict, events and cnxs list
+BASELINE_MEMORY = { 'model.Circles': 5595, 'model.Game': 7825 }
+
+def bench_memory(count=200):
+    """Memory of a game state against the object model, and snapshot/restore against deepcopy."""
+    import copy
+    import tracemalloc
+    import builder
+    import model
+    import sim
+    board = builder.get_board()
+    def size(make):
+        make()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        objects = [ make() for _ in range(count) ]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        return sum(stat.size_diff for stat in after.compare_to(before, 'filename'))/count, objects
+    for name, make in (('model.Circles', lambda: model.Circles(board)), ('model.Game', lambda: model.Game(board))):
+        print(f'{name}: {size(make)[0]:.0f} bytes, object model {BASELINE_MEMORY[name]} bytes')
+    game = model.Game(board)
+    play_game(game, random.Random(0))
+    snapshot = game.snapshot()
+    save, _ = best_time(lambda: [ game.snapshot() for _ in range(count) ])
+    restore, _ = best_time(lambda: [ game.restore(snapshot) for _ in range(count) ])
+    deep, _ = best_time(lambda: [ copy.deepcopy(game) for _ in range(count//10) ])
+    engine = sim.Sim(board)
+    state, _ = best_time(lambda: [ engine.copy() for _ in range(count) ])
+    print(f'snapshot: {len(snapshot)} bytes, {save/count*1e6:.1f} us, restore {restore/count*1e6:.1f} us, '
+          f'deepcopy {deep/(count//10)*1e6:.1f} us, sim copy {state/count*1e6:.1f} us')
+
+def bench_server(sessions=1000, connections=20, rounds=5):
+    """Diffs rebuild the server state, then latencies of a spawned server."""
+    import asyncio
+    import json
+    import tempfile
+    import loadtest
+    import server
+    host = server.Server(seed=0)
+    rng = random.Random(0)
+    for game in range(20):
+        pushes = []
+        writer = type('Writer', (), { 'write': lambda self, line: pushes.append(json.loads(line)) })()
+        reply = host.dispatch({ 'op': 'new', 'room': f'bench{game}' }, writer)
+        session = host.sessions[reply['id']]
+        client = dict(reply['diff'])
+        for _ in range(19):
+            empty = [ num for num, value, _ in client['circles'] if value is None ]
+            diffs = [ host.dispatch({ 'op': 'check', 'id': session.id, 'pair': rng.randrange(5) })['diff'],
+                      host.dispatch({ 'op': 'choose', 'id': session.id, 'circle': rng.choice(empty) })['diff'] ]
+            host.dispatch({ 'op': 'roll', 'room': f'bench{game}' })
+            diffs.append(pushes.pop()['diff'])
+            for diff in diffs:
+                circles = { circle[0]: circle for circle in client['circles'] }
+                circles.update({ circle[0]: circle for circle in diff.pop('circles', ()) })
+                client['circles'] = [ circles[num] for num in sorted(circles) ]
+                client.update(diff)
+        state = session.state()
+        assert client == state
+    with tempfile.TemporaryDirectory() as tmp:
+        unix = os.path.join(tmp, 'server.sock')
+        process, _ = loadtest.spawn(unix)
+        try:
+            for room_size in (0, 10):
+                result = asyncio.run(loadtest.run(sessions, connections, rounds, room_size, unix=unix))
+                loadtest.report(sessions, *result)
+        finally:
+            process.terminate()
+            process.wait()
+
+def bench_sync(games=500):
+    """Games mirrored from encoded deltas, and encode/decode throughput."""
+    import builder
+    import model
+    import sync
+    board = builder.get_board()
+    rng = random.Random(0)
+    random.seed(0)
+    deltas = []
+    sizes = []
+    for _ in range(games):
+        game = model.Game(board, history=4)
+        tracker = sync.Tracker(game)
+        saved = tracker.snapshot()
+        mirror = model.Game(board)
+        sync.load(mirror, saved)
+        for _ in range(10):
+            random_actions(game, rng, 6)
+            if rng.random() < 0.2:
+                game.undo()
+            deltas += tracker.deltas
+            data = tracker.flush()
+            sizes.append(len(data))
+            saved += data
+            sync.load(mirror, data)
+            assert mirror.snapshot() == game.snapshot()
+        loaded = model.Game(board)
+        sync.load(loaded, saved)
+        assert loaded.snapshot() == game.snapshot()
+    data = sync.encode(deltas)
+    assert sync.decode(data) == deltas
+    encode, _ = best_time(sync.encode, deltas)
+    decode, _ = best_time(sync.decode, data)
+    print(f'{games} games match, {len(deltas)} deltas, {len(data)} bytes, '
+          f'{sum(sizes)/len(sizes):.0f} bytes per 6 actions, snapshot {len(game.snapshot())} bytes')
+    print(f'encode {len(deltas)/encode:.0f} deltas/s ({len(data)/encode/1e6:.1f} MB/s), '
+          f'decode {len(deltas)/decode:.0f} deltas/s ({len(data)/decode/1e6:.1f} MB/s)')
+
+def bench_shards(sessions=2000, rounds=3):
+    """Sessions evicted and loaded again keep their state, then scaling by workers."""
+    import tempfile
+    import shards
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        with shards.Host(workers=3, directory=tmp, idle=None) as host:
+            ids = [ reply['id'] for reply in host.requests([ { 'op': 'new' } ]*60) ]
+            for _ in range(5):
+                host.requests([ { 'op': 'check', 'id': sid, 'pair': rng.randrange(5) } for sid in ids ])
+                host.requests([ { 'op': 'choose', 'id': sid, 'circle': rng.randrange(19) } for sid in ids ])
+                host.requests([ { 'op': 'turn', 'id': sid } for sid in ids ])
+            states = host.requests([ { 'op': 'state', 'id': sid } for sid in ids ])
+            assert host.evict() == len(ids)
+            assert host.requests([ { 'op': 'state', 'id': sid } for sid in ids ]) == states
+            assert sum(stats['loaded'] for stats in host.stats()) == len(ids)
+        with shards.Host(workers=2, directory=tmp, idle=0.1, sweep=0.05) as host:
+            ids = [ reply['id'] for reply in host.requests([ { 'op': 'new' } ]*10) ]
+            time.sleep(0.5)
+            assert sum(stats['sessions'] for stats in host.stats()) == 0
+            assert all('diff' in reply for reply in host.requests([ { 'op': 'turn', 'id': sid } for sid in ids ]))
+    print('evicted sessions load with the same state')
+    for workers in range(1, os.cpu_count()+1):
+        speed, memory, snapshot = shards.run(workers, sessions, rounds)
+        print(f'{workers} workers: {speed:.0f} requests/s, {memory:.0f} bytes per session, '
+              f'snapshot {snapshot:.0f} bytes')
+
+def bench_export(games=200):
+    """Offscreen renders against the window, then PNG export of games."""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import tempfile
+    import pygame
+    import ihm
+    import model
+    import render
+    pygame.init()
+    rng = random.Random(0)
+    window = ihm.Window(model.Game())
+    # the window draws changes over the last drawing: paths may be under circles
+    play_game(window.game, rng)
+    surface = render.Renderer().render(window.game)
+    display = pygame.display.get_surface()
+    differ = sum(display.get_at((x, y))[:3] != surface.get_at((x, y))[:3]
+                 for x in range(0, window.size[0], 2) for y in range(0, window.size[1], 2))
+    differ /= window.size[0]*window.size[1]/4
+    assert differ < 0.01, differ
+    print(f'offscreen render differs from the window on {differ:.2%} of pixels')
+    states = []
+    for i in range(games):
+        game = model.Game()
+        play_game(game, rng)
+        states.append((f'game{i}', game.snapshot()))
+    with tempfile.TemporaryDirectory() as tmp:
+        filenames, speed = render.export(states, tmp)
+        assert pygame.image.load(filenames[0]).get_size() == window.size
+        size = sum(os.path.getsize(filename) for filename in filenames)/len(filenames)
+    print(f'{len(filenames)} images, {speed:.0f} images/s on {os.cpu_count()} cores, {size/1024:.0f} KiB each')
+
+def bench_hitmap(clicks=100000):
+    """Hit map lookups against the collide functions of the widgets."""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import ihm
+    import model
+    pygame.init()
+    window = ihm.Window(model.Game())
+    build, _ = best_time(lambda: ihm.HitMap(window.size, window.circles, window.choices, window.dices))
+    rng = random.Random(0)
+    width, height = window.size
+    positions = [ (int(x), int(y)) for x, y in random_clicks(window, clicks//4) ]
+    positions += [ (rng.randrange(width), rng.randrange(height)) for _ in range(len(positions)) ]
+    scan, _ = best_time(lambda: [ collide_hits(window, pos) for pos in positions ])
+    lookup, _ = best_time(lambda: [ window.hits.get(pos) for pos in positions ])
+    print(f'build {build*1000:.1f} ms, click: collide {scan/len(positions)*1e6:.2f} us, '
+          f'hit map {lookup/len(positions)*1e6:.3f} us ({scan/lookup:.0f}x)')
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or [ name[6:] for name in dir() if name.startswith('bench_') ]
+    for name in names:
+        print(f'== {name}')
+        globals()['bench_'+name]()
@@ -1,32 +1,93 @@
 #!/usr/bin/env python
 
-import cv2 
-import numpy as np 
+import os
+import struct
+from array import array
 
-def get_circles(filename):
+# HoughCircles parameters: dp, minDist, param1, param2, minRadius, maxRadius
+HOUGH = (1, 20, 50, 30, 20, 40)
+
+# long side of the images HOUGH parameters are for
+HOUGH_SIZE = 592
+
+# board cache file: magic, image size and mtime, Hough parameters,
+# content key, circles and connections counts
+CACHE_HEADER = struct.Struct('<4sqq6d20sHH')
+CACHE_MAGIC = b'TRK1'
+
+boards = {}
+
+def scale_hough(hough, scale):
+    """Hough parameters for an image scale times bigger."""
+    dp, min_dist, param1, param2, min_radius, max_radius = hough
+    return dp, min_dist*scale, param1, param2, round(min_radius*scale), round(max_radius*scale)
+
+def hough_circles(gray, hough):
+    """(x, y, radius) rows of the circles of a gray image, strongest first."""
+    import cv2
+    import numpy as np
+    dp, min_dist, param1, param2, min_radius, max_radius = hough
+    circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp, min_dist, param1 = param1,
+               param2 = param2, minRadius = min_radius, maxRadius = max_radius)
+    if circles is None:
+        return np.zeros((0, 3), dtype=np.float32)
+    return circles[0]
+
+def board_circles(circles):
+    """Rounded circle centers, all with the mean radius plus one."""
+    import numpy as np
+    circles = np.uint16(np.around(circles))
+    r = int(np.around(np.mean(circles[:, 2]))) + 1
+    return [ (x, y, r) for x, y in circles[:, :2].tolist() ]
+
+def get_circles(filename, hough=HOUGH):
+    import cv2
     img = cv2.imread(filename, cv2.IMREAD_COLOR)
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) 
     gray_blurred = cv2.blur(gray, (3, 3)) 
- 
-    circles = cv2.HoughCircles(gray_blurred,  
-               cv2.HOUGH_GRADIENT, 1, 20, param1 = 50, 
-               param2 = 30, minRadius = 20, maxRadius = 40) 
-    if circles is None:
+    circles = hough_circles(gray_blurred, hough)
+    if not len(circles):
+        return None
+    return board_circles(circles)
+
+def get_circles_scaled(filename, hough=HOUGH, size=HOUGH_SIZE, workers=None, margin=1.5):
+    """
+    Circles of a large board image, in image coordinates: Hough runs on
+    the image scaled down to size, where hough parameters apply, then on
+    a full resolution crop around each circle found, in a thread pool.
+    """
+    import cv2
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    gray = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    height, width = gray.shape
+    scale = max(height, width)/size
+    if scale <= 1:
+        circles = hough_circles(cv2.blur(gray, (3, 3)), hough)
+        return board_circles(circles) if len(circles) else None
+    small = cv2.resize(gray, (round(width/scale), round(height/scale)), interpolation=cv2.INTER_AREA)
+    candidates = hough_circles(cv2.blur(small, (3, 3)), hough)
+    if not len(candidates):
         return None
-    # round values
-    circles = np.uint16(np.around(circles)) 
-    # extract mean radius
-    radius = []
-    for pt in circles[0, :]:
-        radius.append(pt[2])
-    r = int(np.around(np.mean(radius)))
-    r += 1
-    # extract circles
-    defs = []
-    for pt in circles[0, :]:
-        x, y = int(pt[0]), int(pt[1])
-        defs.append((x,y,r))
-    return defs
+    dp, _, param1, param2, _, _ = hough
+    # same blur as on the scaled down image
+    blur = 2*int(1.5*scale)+1
+    def refine(candidate):
+        x, y, r = candidate*scale
+        half = int(r*margin)+1
+        left, top = max(int(x)-half, 0), max(int(y)-half, 0)
+        crop = cv2.blur(gray[top:int(y)+half+1, left:int(x)+half+1], (blur, blur))
+        found = hough_circles(crop, (dp, r/4, param1, param2, int(r*0.8), int(r*1.2)+1))
+        if not len(found):
+            return x, y, r
+        found += (left, top, 0)
+        # circle closest to the candidate
+        return found[np.argmin(np.hypot(found[:, 0]-x, found[:, 1]-y))]
+    with ThreadPoolExecutor(workers) as pool:
+        circles = np.array(list(pool.map(refine, candidates)), dtype=np.float32)
+    return board_circles(circles)
 
 def get_connections(circles):
     cnxs = []
@@ -42,7 +103,167 @@ def get_connections(circles):
                 cnxs.append((i1,i2))
     return cnxs
 
+def grid_pairs(xy, r, r2):
+    """Close pairs using a grid of cells of size r, each point checks 9 cells."""
+    import numpy as np
+    n = len(xy)
+    cells = xy // r
+    cx = cells[:, 0] - cells[:, 0].min() + 1
+    cy = cells[:, 1] - cells[:, 1].min() + 1
+    width = int(cy.max()) + 2
+    keys = cx*width + cy
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    sources = []
+    targets = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            other = keys + dx*width + dy
+            lo = np.searchsorted(sorted_keys, other, 'left')
+            hi = np.searchsorted(sorted_keys, other, 'right')
+            counts = hi - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            i1 = np.repeat(np.arange(n), counts)
+            offsets = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            i2 = order[np.arange(total) + offsets]
+            d = xy[i1] - xy[i2]
+            near = (d*d).sum(axis=1) < r2
+            sources.append(i1[near])
+            targets.append(i2[near])
+    if not sources:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    i1 = np.concatenate(sources)
+    i2 = np.concatenate(targets)
+    order = np.lexsort((i2, i1))
+    return i1[order], i2[order]
+
+def get_connections_fast(circles, csr=False, dense_max=1024):
+    """
+    Same connections as get_connections, computed with numpy.
+    Pairwise distances are used for small boards, a grid index for large ones.
+    Return a list of (i1, i2) pairs, or (indptr, indices) CSR arrays if csr.
+    """
+    import numpy as np
+    pts = np.asarray(circles, dtype=np.int64).reshape(-1, 3)
+    n = len(pts)
+    r = 2*int(pts[0, 2])+6
+    r2 = r*r
+    xy = pts[:, :2]
+    if n <= dense_max:
+        dx = xy[:, 0, None] - xy[None, :, 0]
+        dy = xy[:, 1, None] - xy[None, :, 1]
+        i1, i2 = np.nonzero(dx*dx+dy*dy < r2)
+    else:
+        i1, i2 = grid_pairs(xy, r, r2)
+    # same circle (or duplicated one) is not a connection
+    other = (pts[i1] != pts[i2]).any(axis=1)
+    i1, i2 = i1[other], i2[other]
+    if csr:
+        indptr = np.zeros(n+1, dtype=np.int64)
+        np.cumsum(np.bincount(i1, minlength=n), out=indptr[1:])
+        return indptr, i2
+    return list(zip(i1.tolist(), i2.tolist()))
+
+def board_key(filename, hough=HOUGH):
+    """Hash of the image content and of the detection parameters."""
+    import hashlib
+    key = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        key.update(f.read())
+    key.update(repr(hough).encode())
+    return key.digest()
+
+def read_board(cachename, stat, hough=HOUGH, key=None):
+    """
+    Read board from cache file, None if missing or stale.
+    Content key is checked only if image size or date changed.
+    """
+    try:
+        with open(cachename, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < CACHE_HEADER.size:
+        return None
+    magic, size, mtime, *params, cached_key, n, m = CACHE_HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or tuple(params) != hough:
+        return None
+    if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+        if key is None or key != cached_key:
+            return None
+    values = array('H')
+    values.frombytes(data[CACHE_HEADER.size:])
+    if len(values) != 3*n+2*m:
+        return None
+    circles = [ tuple(values[i:i+3]) for i in range(0, 3*n, 3) ]
+    cnxs = [ tuple(values[i:i+2]) for i in range(3*n, 3*n+2*m, 2) ]
+    return circles, cnxs
+
+def write_board(cachename, stat, hough, key, circles, cnxs):
+    values = array('H')
+    for circle in circles:
+        values.extend(circle)
+    for cnx in cnxs:
+        values.extend(cnx)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, stat.st_size, stat.st_mtime_ns,
+                               *hough, key, len(circles), len(cnxs))
+    tmpname = cachename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(header)
+        f.write(values.tobytes())
+    os.replace(tmpname, cachename)
+
+def get_board(filename='dunai.jpg', hough=HOUGH):
+    """
+    Return circles and connections of a board image.
+    Result is shared in process and cached on disk next to the image,
+    detection runs again only if image content or parameters change.
+    """
+    name = (os.path.abspath(filename), hough)
+    if name in boards:
+        return boards[name]
+    cachename = filename + '.board'
+    stat = os.stat(filename)
+    board = read_board(cachename, stat, hough)
+    if board is None:
+        key = board_key(filename, hough)
+        board = read_board(cachename, stat, hough, key)
+        if board is None:
+            circles = get_circles(filename, hough)
+            if circles is None:
+                return None
+            board = circles, get_connections_fast(circles)
+        # (re)write cache to store new content or new image date
+        try:
+            write_board(cachename, stat, hough, key, *board)
+        except OSError:
+            pass
+    boards[name] = board
+    return board
+
+def load_board(board=None):
+    """
+    Circles and connections of a board: the default image board if None,
+    a board library id if a string, else board itself.
+    """
+    if board is None:
+        return get_board('dunai.jpg')
+    if isinstance(board, str):
+        import library
+        return library.get_board(board)
+    return board
+
+def board_image(board=None):
+    """Image of a board given like to load_board."""
+    if isinstance(board, str):
+        import library
+        return library.get_library().image(board)
+    return 'dunai.jpg'
+
 if __name__ == "__main__":
+    import cv2
     filename = 'dunai.jpg'
     img = cv2.imread(filename, cv2.IMREAD_COLOR)
     circles = get_circles(filename)
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+"""
+Game logs: Game.turn, Game.check and Game.choose calls of a batch of
+games recorded in one append-only file, and a replay engine.
+
+A log file is a header followed by fixed-width records
+(game, operation, argument, argument), so it can be memory-mapped and
+read as a numpy array. Replay follows the rules of model.Game on plain
+arrays, without events nor widgets, and jumps to any move of a game
+from checkpoints taken every few moves.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import builder
+import model
+
+
+MAGIC = b'TRKG'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+RECORD = struct.Struct('<IBBBx')
+# op, arg and arg2 of a record
+MOVE = struct.Struct('<4xBBBx')
+DTYPE = np.dtype([('game', '<u4'), ('op', 'u1'), ('arg', 'u1'), ('arg2', 'u1'), ('pad', 'u1')])
+
+TURN, CHECK, CHOOSE, END = range(4)
+
+NONE = model.NONE
+
+# circle values are below VALUES
+VALUES = max(max(values) for row in model.PAIR_TABLE for values in row)+1
+
+
+class Recorder:
+    """
+    Append records of games on board to a log file, given to
+    model.Game(log=...). Records are buffered, call close() or use it as a context manager.
+    """
+    def __init__(self, filename, board=None, buffer=1 << 16):
+        self.count = count = len(builder.load_board(board)[0])
+        self.buffer = bytearray()
+        self.buffer_size = buffer
+        self.games = 0
+        self.open = set()
+        if os.path.exists(filename) and os.path.getsize(filename) >= HEADER.size:
+            self.file = open(filename, 'r+b')
+            check_header(self.file.read(HEADER.size), count)
+            size = self.file.seek(0, os.SEEK_END)
+            size -= (size-HEADER.size) % RECORD.size
+            self.file.truncate(size)
+            self.file.seek(size)
+            if size > HEADER.size:
+                # continue game numbers after the highest one, games are interleaved
+                games = np.fromfile(filename, DTYPE, (size-HEADER.size)//RECORD.size, offset=HEADER.size)
+                self.games = int(games['game'].max())+1
+        else:
+            self.file = open(filename, 'wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION, count))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """Number of a new game."""
+        game = self.games
+        self.games += 1
+        self.open.add(game)
+        return game
+
+    def write(self, game, op, arg=0, arg2=0):
+        self.buffer += RECORD.pack(game, op, arg, arg2)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def turn(self, game, red, yellow):
+        self.write(game, TURN, red, yellow)
+
+    def check(self, game, pair):
+        self.write(game, CHECK, pair)
+
+    def choose(self, game, num):
+        self.write(game, CHOOSE, num)
+
+    def end(self, game):
+        """Mark the end of a game, replay returns it without waiting for the end of file."""
+        self.write(game, END)
+        self.open.discard(game)
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        for game in sorted(self.open):
+            self.end(game)
+        self.flush()
+        self.file.close()
+
+
+def check_header(header, count=None):
+    magic, version, circles = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('not a game log')
+    if version != VERSION:
+        raise ValueError(f'game log version {version}, expected {VERSION}')
+    if count is not None and circles != count:
+        raise ValueError(f'game log for {circles} circles, board has {count}')
+    return circles
+
+
+class Replay:
+    """
+    State of a game rebuilt from its records, same rules as model.Game:
+    circle values and mapped flags, choices, current circle and value,
+    dices, and paths as lists of circles.
+    """
+    def __init__(self, board=None):
+        board = builder.load_board(board)
+        circles, cnxs = board
+        count = len(circles)
+        self.masks = model.get_adjacency(count, cnxs)[1]
+        self.edges = tuple(sorted({ (min(i, j), max(i, j)) for i, j in cnxs if i != j }))
+        bonus = model.Score()
+        self.bonus = [ bonus.bonus_for(size) for size in range(count+1) ]
+        self.reset()
+
+    def reset(self):
+        count = len(self.masks)
+        self.values = bytearray([NONE])*count
+        self.mapped = bytearray(count)
+        # circles of each value
+        self.occupancy = [0]*VALUES
+        self.choices = [0]*len(model.Pair)
+        self.circle = None
+        self.value = None
+        self.red = None
+        self.yellow = None
+        self.pairs = None
+        self.paths = []
+        self.index = [None]*count
+
+    def copy(self):
+        other = Replay.__new__(Replay)
+        other.__dict__.update(self.__dict__)
+        other.values = self.values[:]
+        other.mapped = self.mapped[:]
+        other.occupancy = self.occupancy[:]
+        other.choices = self.choices[:]
+        other.paths = [ circles[:] for circles in self.paths ]
+        other.index = [None]*len(self.index)
+        for path in other.paths:
+            for num in path:
+                other.index[num] = path
+        return other
+
+    def apply(self, op, arg, arg2):
+        """Play one record."""
+        self.play(((op, arg, arg2),))
+
+    def play(self, records):
+        """Play (op, arg, arg2) records, like Game.turn, Game.check and Game.choose."""
+        values = self.values
+        mapped = self.mapped
+        occupancy = self.occupancy
+        masks = self.masks
+        choices = self.choices
+        table = model.PAIR_TABLE
+        circle = self.circle
+        value = self.value
+        red = self.red
+        yellow = self.yellow
+        pairs = self.pairs
+        for op, arg, arg2 in records:
+            if op == CHOOSE:
+                if circle is not None:
+                    self.link(circle, arg)
+                    continue
+                circle = arg
+                if value is None:
+                    continue
+            elif op == CHECK:
+                choices[arg] += 1
+                value = pairs[arg]
+                if circle is None:
+                    continue
+            else:
+                red = arg
+                yellow = arg2
+                pairs = table[arg-1][arg2]
+                value = None
+                circle = None
+                continue
+            # set circle value, and check mapping if not already done
+            bit = 1 << circle
+            old = values[circle]
+            if old != NONE:
+                occupancy[old] ^= bit
+            occupancy[value] |= bit
+            values[circle] = value
+            if not mapped[circle]:
+                same = masks[circle] & occupancy[value]
+                if same:
+                    mapped[circle] = 1
+                    for other in model.bits(same):
+                        mapped[other] = 1
+        self.circle = circle
+        self.value = value
+        self.red = red
+        self.yellow = yellow
+        self.pairs = pairs
+
+    def append(self, path, num):
+        path.append(num)
+        self.index[num] = path
+
+    def top(self, path):
+        """Same as model.Path.top."""
+        values = self.values
+        return max(path, key=lambda num: (-1 if values[num] == NONE else values[num], num))
+
+    def link(self, new_num, num):
+        """Same as model.Paths.add."""
+        existing = self.index[new_num]
+        path = self.index[num]
+        if new_num == num:
+            # not a segment
+            pass
+        elif path is not None:
+            if existing is None:
+                self.append(path, new_num)
+            elif existing is not path:
+                # merge the smaller path in the bigger one
+                if len(existing) < len(path):
+                    existing, path = path, existing
+                for moved in path:
+                    self.append(existing, moved)
+                for i, other in enumerate(self.paths):
+                    if other is path:
+                        del self.paths[i]
+                        break
+        elif existing is not None:
+            self.append(existing, num)
+        else:
+            path = [ new_num ]
+            self.index[new_num] = path
+            self.append(path, num)
+            self.paths.append(path)
+
+    def map_score(self):
+        """Same as model.ScoreMap.score."""
+        values = self.values
+        parent = list(range(len(values)))
+        for i, j in self.edges:
+            if values[i] == values[j] != NONE:
+                while parent[i] != i:
+                    i = parent[i]
+                while parent[j] != j:
+                    j = parent[j]
+                # the root of a map is its lowest circle
+                if i < j:
+                    parent[j] = i
+                elif j < i:
+                    parent[i] = j
+        sizes = [0]*len(values)
+        for num in range(len(values)):
+            root = num
+            while parent[root] != root:
+                root = parent[root]
+            sizes[root] += 1
+        points = [ values[root]+size-1 for root, size in enumerate(sizes) if size >= 2 ]
+        bonus = self.bonus[max(sizes)]
+        return points, bonus, sum(points)+bonus
+
+    def path_score(self):
+        """Same as model.ScorePath.score."""
+        points = []
+        max_size = 0
+        for circles in self.paths:
+            top = self.top(circles)
+            if self.values[top] != NONE:
+                points.append(self.values[top]+len(circles)-1)
+                max_size = max(max_size, len(circles))
+        if not points:
+            return (), 0, 0
+        bonus = self.bonus[max_size]
+        return tuple(points), bonus, sum(points)+bonus
+
+    def snapshot(self):
+        """State in the format of model.Game.snapshot, to show it with Game.restore."""
+        count = len(self.values)
+        parents = bytearray([NONE])*count
+        order = bytearray([NONE])*count
+        for i, circles in enumerate(self.paths):
+            root = min(circles)
+            order[i] = root
+            for num in circles:
+                parents[num] = root
+        current = bytes(NONE if value is None else value for value in
+                        (self.circle, self.value, self.red, self.yellow))
+        return b''.join((self.values, self.mapped, parents, order, bytes(self.choices), current))
+
+
+class GameLog:
+    """Memory-mapped log file."""
+    def __init__(self, filename, board=None):
+        board = builder.load_board(board)
+        self.board = board
+        with open(filename, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = check_header(self.map[:HEADER.size], len(board[0]))
+        size = len(self.map) - HEADER.size
+        # a partly written last record is ignored
+        self.data = memoryview(self.map)[HEADER.size:HEADER.size+size-size % RECORD.size]
+        # moves and checkpoint states by (game, every)
+        self.checkpoints = {}
+
+    def __len__(self):
+        return len(self.data)//RECORD.size
+
+    def close(self):
+        self.data.release()
+        self.map.close()
+
+    def records(self):
+        """(game, op, arg, arg2) of all records, in file order."""
+        return RECORD.iter_unpack(self.data)
+
+    def array(self):
+        """Records as a numpy structured array, without copy."""
+        return np.frombuffer(self.data, dtype=DTYPE)
+
+    def replay(self, chunk=1 << 20):
+        """
+        Stream (game, Replay) of all games, each one at its end record or
+        at the end of file. A Replay is reused once the next game is read.
+        Records are played by runs of the same game, found by chunks.
+        """
+        states = {}
+        spare = []
+        blank = Replay(self.board)
+        records = self.array()
+        for start in range(0, len(records), chunk):
+            part = records[start:start+chunk]
+            games = part['game']
+            ends = part['op'] == END
+            # runs of records of a game, ended by a change of game or an end record
+            bounds = np.flatnonzero((games[1:] != games[:-1]) | ends[:-1]) + 1
+            bounds = np.concatenate(([0], bounds, [len(part)]))
+            for begin, end, game, ended in zip(bounds[:-1].tolist(), bounds[1:].tolist(),
+                                               games[bounds[:-1]].tolist(), ends[bounds[1:]-1].tolist()):
+                state = states.get(game)
+                if state is None:
+                    if spare:
+                        state = spare.pop()
+                        state.reset()
+                    else:
+                        state = blank.copy()
+                    states[game] = state
+                state.play(MOVE.iter_unpack(self.data[(start+begin)*RECORD.size:
+                                                      (start+end-ended)*RECORD.size]))
+                if ended:
+                    yield game, states.pop(game)
+                    spare.append(state)
+        for game in sorted(states):
+            yield game, states[game]
+
+    def moves(self, game):
+        """Records of a game, as (op, arg, arg2)."""
+        records = self.array()
+        records = records[records['game'] == game]
+        records = records[records['op'] != END]
+        return list(zip(records['op'].tolist(), records['arg'].tolist(), records['arg2'].tolist()))
+
+    def seek(self, game, move, every=16):
+        """Replay of a game after its first move records, from checkpoints every few moves."""
+        key = (game, every)
+        if key not in self.checkpoints:
+            moves = self.moves(game)
+            state = Replay(self.board)
+            states = [ state.copy() ]
+            for i, record in enumerate(moves, 1):
+                state.apply(*record)
+                if i % every == 0:
+                    states.append(state.copy())
+            self.checkpoints[key] = (moves, states)
+        moves, states = self.checkpoints[key]
+        move = min(move, len(moves))
+        state = states[move//every].copy()
+        for record in moves[move//every*every:move]:
+            state.apply(*record)
+        return state
+
+
+def main():
+    import runner
+    parser = argparse.ArgumentParser(description='Replay game logs and print their scores.')
+    parser.add_argument('filenames', nargs='+')
+    parser.add_argument('--histogram', action='store_true')
+    args = parser.parse_args()
+    for filename in args.filenames:
+        log = GameLog(filename)
+        maps = runner.Stats()
+        paths = runner.Stats()
+        for _, state in log.replay():
+            maps.add(state.map_score()[2])
+            paths.add(state.path_score()[2])
+        print(f'{filename}: {len(log)} records')
+        log.close()
+        for name, stats in (('map', maps), ('path', paths)):
+            print(f'{name}: {stats}')
+            if args.histogram:
+                runner.print_histogram(stats)
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,146 @@
 
 import random
 import math
+import time
+from array import array
+from collections import OrderedDict
 
 import pygame
 
-import builder
 import model
 
 
-pygame.init()
-
 BLACK = pygame.Color('black')
 
+# set by Window
+screen = None
+background = None
+
+fonts = {}
+
+def get_font(size):
+    if size not in fonts:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        fonts[size] = pygame.font.Font('freesansbold.ttf', size)
+    return fonts[size]
+
+class SurfaceCache:
+    """Rendered surfaces by key, the least recently used are dropped first."""
+    def __init__(self, size=512):
+        self.size = size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, make):
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = make()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits/total if total else 0.
+
+    def text(self, font_size, text, rotation=0):
+        def make():
+            surface = get_font(font_size).render(text, True, BLACK)
+            if rotation:
+                surface = pygame.transform.rotate(surface, rotation)
+            return surface
+        return self.get((font_size, text, rotation), make)
+
+    def hatch(self, radius):
+        """Hatching of mapped circles, centered in a (2*radius+1) square."""
+        def make():
+            surface = pygame.Surface((2*radius+1, 2*radius+1), pygame.SRCALPHA)
+            dec = math.radians(45)
+            for d in range(-radius,radius, 5):
+                a = math.acos(d/radius)
+                start = (radius + radius*math.cos(dec+a), radius + radius*math.sin(dec+a))
+                stop = (radius + radius*math.cos(dec-a), radius + radius*math.sin(dec-a))
+                pygame.draw.line(surface, (127,127,127), start, stop)
+            return surface
+        return self.get(('hatch', radius), make)
+
+surfaces = SurfaceCache()
+
+def redraw(widget):
+    """Draw a changed widget on the screen, offscreen widgets have none."""
+    if screen is not None:
+        screen.draw(widget)
+
+def union(rects):
+    """Bounding rectangle of the rectangles changed by a draw, None if none."""
+    rects = [ rect for rect in rects if rect is not None ]
+    if not rects:
+        return None
+    return rects[0].unionall(rects[1:])
+
+
+class Screen:
+    """
+    Display surface and the rectangles changed since the last push.
+    Widgets draw through draw(), which records the rectangle they return.
+    """
+    def __init__(self, display):
+        self.display = display
+        self.dirty = []
+        # counters
+        self.frames = 0
+        self.pixels = 0
+        self.frame_time = 0.
+        self.total_time = 0.
+        self.draw_time = 0.
+        self.frame_draw_time = 0.
+
+    def mark(self, rect):
+        if rect is not None:
+            self.dirty.append(rect.clip(self.display.get_rect()))
+
+    def draw(self, widget):
+        start = time.perf_counter()
+        self.mark(widget.draw(self.display))
+        self.draw_time += time.perf_counter() - start
+
+    def push(self, start=None):
+        """Send changed rectangles to the window, start is the time of the event."""
+        rects = [ rect for rect in self.dirty if rect.width and rect.height ]
+        self.dirty = []
+        self.frame_draw_time = self.draw_time
+        self.draw_time = 0.
+        if not rects:
+            return
+        pygame.display.update(rects)
+        self.frames += 1
+        self.pixels += sum(rect.width*rect.height for rect in rects)
+        if start is not None:
+            self.frame_time = time.perf_counter() - start
+            self.total_time += self.frame_time
+
+    def stats(self):
+        frames = max(self.frames, 1)
+        return {
+            'frames': self.frames,
+            'pixels': self.pixels,
+            'pixels_per_frame': self.pixels/frames,
+            'frame_time': self.frame_time,
+            'mean_frame_time': self.total_time/frames,
+            'draw_time': self.frame_draw_time,
+            'cache_hit_rate': surfaces.hit_rate(),
+        }
+
 
 class Circle:
-    font = pygame.font.Font('freesansbold.ttf', 50)
+    font_size = 50
     debug = False
 
     def __init__(self, circle_model, center, radius):
@@ -30,40 +156,43 @@ class Circle:
         return sqx + sqy < self.radius**2
     
     def update(self):
-        self.draw(display)
-
-    def rotate(self, a):
-        return (self.center[0] + self.radius*math.cos(a),
-                self.center[1] + self.radius*math.sin(a) )
+        redraw(self)
+
+    def sprite(self):
+        """Circle value, hatching and debug number in one surface centered on the circle."""
+        num = self.model.num if self.debug else None
+        value = self.model.value
+        mapped = self.model.mapped
+        def make():
+            text = None
+            size = 2*self.radius+1
+            if value is not None:
+                text = surfaces.text(self.font_size, str(value))
+                size = max(size, *text.get_size())
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            center = (size//2, size//2)
+            if num is not None:
+                label = surfaces.text(10, str(num))
+                rect = label.get_rect(center=center)
+                rect.move_ip(self.radius*1/2,-self.radius*1/2)
+                surface.blit(label, rect)
+            if text is not None:
+                surface.blit(text, text.get_rect(center=center))
+            if mapped:
+                hatch = surfaces.hatch(self.radius)
+                surface.blit(hatch, hatch.get_rect(center=center))
+            return surface
+        return surfaces.get(('circle', self.radius, value, mapped, num), make)
 
     def draw(self, display):
-        if self.debug:
-            font2 = pygame.font.Font('freesansbold.ttf', 10)
-            text = font2.render(str(self.model.num), True, BLACK)
-            rect = text.get_rect(center=self.center)
-            rect.move_ip(self.radius*1/2,-self.radius*1/2)
-            display.blit(text, rect)
-        if self.model.value is not None:
-            text = self.font.render(str(self.model.value), True, BLACK)
-            rect = text.get_rect(center=self.center)
-            display.blit(text, rect)
-        if self.model.mapped:
-            dec = math.radians(45)
-            for d in range(-self.radius,self.radius, 5):
-                a = math.acos(d/self.radius)
-                #pygame.draw.circle(display, (255,0,0), self.center, self.radius)
-                start = self.rotate(dec+a)
-                stop = self.rotate(dec-a)
-                pygame.draw.line(display, (127,127,127), start, stop)
+        sprite = self.sprite()
+        return display.blit(sprite, sprite.get_rect(center=self.center))
 
 class Circles:
     def __init__(self, circles_model):
         self.model = circles_model
         self.circles = []
-        circles = builder.get_circles('dunai.jpg')
-        if len(circles)!=19:
-            raise Exception('missing circles')
-        for i,circle in enumerate(circles):
+        for i,circle in enumerate(self.model.geometry):
             x,y,r = circle
             c = Circle(self.model[i], (x,y), r)
             self.circles.append(c)
@@ -75,8 +204,7 @@ class Circles:
         return None
 
     def draw(self, display):
-        for c in self.circles:
-            c.draw(display)
+        return union([ c.draw(display) for c in self.circles ])
 
 class Path:
     def __init__(self, path_model, circles):
@@ -85,7 +213,7 @@ class Path:
         self.circles = circles
         
     def update(self):
-        self.draw(display)
+        redraw(self)
 
     def draw_path(self, display, c1, c2):
         x1,y1 = c1.center
@@ -94,39 +222,47 @@ class Path:
         f = 0.75
         x1,y1 = x1+vx*f,y1+vy*f
         x2,y2 = x2-vx*f,y2-vy*f
-        pygame.draw.line(display, BLACK, (x1,y1), (x2,y2), 8)
+        return pygame.draw.line(display, BLACK, (x1,y1), (x2,y2), 8)
 
     def draw(self, display):
         path = self.model.path
         if path is None: return
         count = len(path)
         if count<2: return
+        rects = []
         for i in range(count-1):
             c1 = self.circles[path[i].num]
             c2 = self.circles[path[i+1].num]
-            self.draw_path(display, c1, c2)
+            rects.append(self.draw_path(display, c1, c2))
+        return union(rects)
 
 class Paths:
     def __init__(self, paths_model, circles):
         self.model = paths_model
         self.model.subscribe('update', self.update)
         self.circles = circles
-        self.paths = []
+        # widget of each model path
+        self.paths = {}
         self.update()
 
     def update(self):
-        for mpath in self.model.paths[len(self.paths):]:
-            path = Path(mpath, self.circles)
-            self.paths.append(path)
-            path.draw(display)
+        mpaths = set(self.model.paths)
+        # forget paths merged in an other one
+        for mpath in list(self.paths):
+            if mpath not in mpaths:
+                del self.paths[mpath]
+        for mpath in self.model.paths:
+            if mpath not in self.paths:
+                path = Path(mpath, self.circles)
+                self.paths[mpath] = path
+                redraw(path)
 
     def draw(self, display):
-        for p in self.paths:
-            p.draw(display)
+        return union([ p.draw(display) for p in self.paths.values() ])
 
 
 class Dice:
-    font = pygame.font.Font('freesansbold.ttf', 64)
+    font_size = 64
     def __init__(self, dice_model, pos, color=(255, 255, 255)):
         self.model = dice_model
         self.model.subscribe('update', self.update)
@@ -136,38 +272,36 @@ class Dice:
         self.values = {}
         #font = pygame.font.SysFont('Comic Sans MS', 64, true)
         for value in range(self.model.min, self.model.max+1):
-            text = self.font.render(str(value), True, BLACK)
-            self.values[value] = text
+            self.values[value] = surfaces.text(self.font_size, str(value))
 
     def collide(self, p):
         return self.rect.collidepoint(p)
 
     def update(self):
-        self.draw(display)
+        redraw(self)
 
     def draw(self, display):
         pygame.draw.rect(display, self.color, self.rect, border_radius=8)
-        if self.model.value is None:
-            return
-        img = self.values[self.model.value]
-        display.blit(img, (self.rect.x+14, self.rect.y+4))
-        # for comic  display.blit(img, (self.pos[0]+14, self.pos[1]-12))
+        if self.model.value is not None:
+            img = self.values[self.model.value]
+            display.blit(img, (self.rect.x+14, self.rect.y+4))
+            # for comic  display.blit(img, (self.pos[0]+14, self.pos[1]-12))
+        return self.rect
 
 class Dices:
     def __init__(self, dices_model):
         self.model = dices_model
-        self.yellow = Dice(model.game.dices.yellow, (260,10), pygame.Color('yellow'))
-        self.red = Dice(model.game.dices.red, (260+70,10), pygame.Color('red'))
+        self.yellow = Dice(self.model.yellow, (260,10), pygame.Color('yellow'))
+        self.red = Dice(self.model.red, (260+70,10), pygame.Color('red'))
 
     def collide(self, p):
         return self.yellow.collide(p) or self.red.collide(p)
 
     def draw(self, display):
-        self.yellow.draw(display)
-        self.red.draw(display)
+        return union([ self.yellow.draw(display), self.red.draw(display) ])
 
 class Values:
-    font = pygame.font.Font('freesansbold.ttf', 20)
+    font_size = 20
     def __init__(self, dices_model):
         self.model = dices_model
         self.model.subscribe('update', self.update)
@@ -181,11 +315,10 @@ class Values:
             self.old_rect[pair] = None
 
     def update(self):
-        self.draw(display)
+        redraw(self)
         
     def draw_pair(self, display, value, pos):
-        text = self.font.render(str(value), True, BLACK)
-        text = pygame.transform.rotate(text, 2)
+        text = surfaces.text(self.font_size, str(value), 2)
         rect = text.get_rect()
         rect.move_ip(pos)
         display.blit(text, pos)
@@ -195,11 +328,31 @@ class Values:
         pairs = self.model.pairing()
         if pairs is None:
             return
+        rects = []
         for pair,pos in self.positions.items():
             if self.old_rect[pair] is not None:
-                display.blit(background, pos, self.old_rect[pair])
+                rects.append(display.blit(background, pos, self.old_rect[pair]))
             value = pairs[pair]
             self.old_rect[pair] = self.draw_pair(display, value, pos)
+            rects.append(self.old_rect[pair])
+        return union(rects)
+
+def inside(points, p):
+    """If p is in the convex polygon of points."""
+    pos = 0 
+    neg = 0 
+    for i in range(len(points)):
+        p1 = points[i]
+        i = (i+1) % len(points)
+        p2 = points[i]
+        cross = (p[0]-p1[0])*(p2[1]-p1[1])-(p[1]-p1[1])*(p2[0]-p1[0])
+        if cross>0:
+            pos+=1
+        if cross<0:
+            neg+=1
+        if pos>0 and neg>0:
+            return False
+    return True
 
 class Choices:
     pos = (470, 25)
@@ -211,7 +364,7 @@ class Choices:
         self.model.subscribe('update', self.update)
     
     def update(self):
-        self.draw(display)
+        redraw(self)
 
     def rotate(self, n, m):
         return (self.pos[0]+n*self.size[0]*math.cos(self.angle)-m*self.size[1]*math.sin(self.angle),
@@ -226,33 +379,21 @@ class Choices:
 
     def draw_check(self, display, n, m):
         p1, p2, p3, p4 = self.get_pos(n,m)
-        pygame.draw.line(display, BLACK, p1, p3, 5)
-        pygame.draw.line(display, BLACK, p2, p4, 5)
+        return union([ pygame.draw.line(display, BLACK, p1, p3, 5),
+                       pygame.draw.line(display, BLACK, p2, p4, 5) ])
 
     def draw(self, display):
+        rects = []
         for pair in model.Pair:
             count = self.model.count(pair)
             if count<=0:
                 continue
             for n in range(count):
-                self.draw_check(display, n, pair)
+                rects.append(self.draw_check(display, n, pair))
+        return union(rects)
 
     def collide_check(self, n, m, p):
-        points = self.get_pos(n,m)
-        pos = 0 
-        neg = 0 
-        for i in range(len(points)):
-            p1 = points[i]
-            i = (i+1) % len(points)
-            p2 = points[i]
-            cross = (p[0]-p1[0])*(p2[1]-p1[1])-(p[1]-p1[1])*(p2[0]-p1[0])
-            if cross>0:
-                pos+=1
-            if cross<0:
-                neg+=1
-            if pos>0 and neg>0:
-                return False
-        return True
+        return inside(self.get_pos(n,m), p)
 
     def collide(self, pos):
         for pair in model.Pair:
@@ -263,7 +404,7 @@ class Choices:
         return None
 
 class Score:
-    font = pygame.font.Font('freesansbold.ttf', 20)
+    font_size = 20
     points_nb = 8
 
     def __init__(self, score_model):
@@ -271,25 +412,30 @@ class Score:
         self.model.subscribe('update', self.update)
 
     def update(self):
-        self.draw(display)
+        redraw(self)
 
     def draw_value(self, display, rect, value):
         display.blit(background, rect.topleft, rect)
-        text = self.font.render(str(value), True, BLACK)
-        text_rect = text.get_rect(center=rect.center)
-        display.blit(text, text_rect)
+        if value is not None:
+            text = surfaces.text(self.font_size, str(value))
+            text_rect = text.get_rect(center=rect.center)
+            display.blit(text, text_rect)
+        return rect.copy()
 
     def draw_points(self, display, rects, points):
         rect = rects.copy()
-        for point in points:
-            self.draw_value(display, rect, point)
+        changed = []
+        # clear boxes of maps or paths merged since last draw
+        for i in range(max(self.points_nb, len(points))):
+            changed.append(self.draw_value(display, rect, points[i] if i<len(points) else None))
             rect.move_ip(rect.width,0)
+        return union(changed)
 
     def draw(self, display):
         points, bonus, total = self.model.score()
-        self.draw_points(display, self.points_rect, points)
-        self.draw_value(display, self.bonus_rect, bonus)
-        self.draw_value(display, self.total_rect, total)
+        return union([ self.draw_points(display, self.points_rect, points),
+                       self.draw_value(display, self.bonus_rect, bonus),
+                       self.draw_value(display, self.total_rect, total) ])
 
 class ScorePath(Score):
     points_rect = pygame.Rect((43, 500),(28,28))
@@ -301,43 +447,120 @@ class ScoreMaps(Score):
     bonus_rect = pygame.Rect((289, 546),(28,28))
     total_rect = pygame.Rect((342, 546),(34,28))
 
-display = pygame.display.set_mode((592, 592))
-background = pygame.image.load("dunai.jpg").convert()
-display.blit(background, (0,0))
-
-circles = Circles(model.game.circles)
-circles.draw(display)
-values = Values(model.game.dices)
-values.draw(display)
-choices = Choices(model.game.choices)
-dices = Dices(model.game.dices.yellow)
-dices.draw(display)
-paths = Paths(model.game.paths, circles.circles)
-paths.draw(display)
-score_path = ScorePath(model.game.score_path)
-score_maps = ScoreMaps(model.game.score_maps)
-
-pygame.display.flip()
-
-while True:
-    for event in pygame.event.get():
+class HitMap:
+    """
+    Widget and id under each pixel of the window, painted once with the
+    collide functions of the widgets on their bounding boxes, so that a
+    click is one lookup. Circles are over choices, over dices.
+    Circles are painted by rows, with the spans where they collide.
+    """
+    def __init__(self, size, circles, choices, dices):
+        self.width, self.height = size
+        self.labels = array('H', bytes(2*self.width*self.height))
+        # (widget, id) of each label, None for nothing
+        self.targets = [None]
+        self.paint(dices.yellow.rect.union(dices.red.rect), dices.collide, (dices, None))
+        for pair in reversed(model.Pair):
+            for n in reversed(range(choices.model.max_count())):
+                points = choices.get_pos(n, pair)
+                xs, ys = zip(*points)
+                box = pygame.Rect(math.floor(min(xs)), math.floor(min(ys)), 0, 0)
+                box.width = math.ceil(max(xs)) - box.x + 1
+                box.height = math.ceil(max(ys)) - box.y + 1
+                self.paint(box, lambda p, points=points: inside(points, p), (choices, pair))
+        for i, circle in reversed(list(enumerate(circles.circles))):
+            self.paint_circle(circle, (circles, i))
+
+    def paint(self, box, collide, target):
+        box = box.clip(pygame.Rect(0, 0, self.width, self.height))
+        label = len(self.targets)
+        self.targets.append(target)
+        labels = self.labels
+        for y in range(box.top, box.bottom):
+            row = y*self.width
+            for x in range(box.left, box.right):
+                if collide((x, y)):
+                    labels[row+x] = label
+
+    def paint_circle(self, circle, target):
+        label = len(self.targets)
+        self.targets.append(target)
+        (cx, cy), r = circle.center, circle.radius
+        for dy in range(-r+1, r):
+            y = cy + dy
+            if not 0 <= y < self.height:
+                continue
+            # dx*dx + dy*dy < r*r
+            dx = math.isqrt(r*r - dy*dy - 1)
+            left = max(cx - dx, 0)
+            right = min(cx + dx + 1, self.width)
+            if left < right:
+                row = y*self.width
+                self.labels[row+left:row+right] = array('H', [label])*(right-left)
+
+    def get(self, pos):
+        """(widget, id) at the pixel of pos, None if nothing."""
+        x, y = math.floor(pos[0]), math.floor(pos[1])
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.targets[self.labels[y*self.width+x]]
+        return None
+
+class Window:
+    """Board window, redraws only what each user action changed."""
+    size = (592, 592)
+
+    def __init__(self, game):
+        global screen, background
+        self.game = game
+        display = pygame.display.set_mode(self.size)
+        background = pygame.image.load(game.circles.image).convert()
+        display.blit(background, (0,0))
+        screen = Screen(display)
+
+        self.circles = Circles(game.circles)
+        self.circles.draw(display)
+        self.values = Values(game.dices)
+        self.values.draw(display)
+        self.choices = Choices(game.choices)
+        self.dices = Dices(game.dices)
+        self.dices.draw(display)
+        self.paths = Paths(game.paths, self.circles.circles)
+        self.paths.draw(display)
+        self.score_path = ScorePath(game.score_path)
+        self.score_maps = ScoreMaps(game.score_maps)
+        self.hits = HitMap(self.size, self.circles, self.choices, self.dices)
+
+        pygame.display.flip()
+
+    def click(self, pos):
+        target = self.hits.get(pos)
+        if target is None:
+            return
+        widget, i = target
+        if widget is self.circles:
+            self.game.choose(i)
+        elif widget is self.choices:
+            self.game.check(i)
+        elif widget is self.dices:
+            self.game.turn()
+
+    def handle(self, event):
+        """Process an event and push the changes, False on quit."""
+        start = time.perf_counter()
         if event.type == pygame.QUIT:
-            raise SystemExit
+            return False
         elif event.type == pygame.MOUSEBUTTONUP:
-            pos = pygame.mouse.get_pos()
-            
-            circle = circles.collide(pos)
-            if circle is not None:
-                model.game.choose(circle)
-                pygame.display.flip()
-            
-            pair = choices.collide(pos)
-            if pair is not None:
-                model.game.check(pair)
-                pygame.display.flip()
-                
-            if dices.collide(pos):
-                model.game.turn()
-                pygame.display.flip()
-
-    pygame.time.wait(100)
+            self.click(event.pos)
+        screen.push(start)
+        return True
+
+    def run(self):
+        while self.handle(pygame.event.wait()):
+            pass
+
+def main():
+    pygame.init()
+    Window(model.get_game()).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+Opt-in counters and timers of the hot paths: event triggers and
+sends by event name, sends with their number of subscribers, ScoreMap and ScorePath scores,
+Paths.add and path merges, and the draw of each ihm widget class.
+
+enable() wraps these methods in place and disable() puts back the
+originals, so nothing is measured nor slowed down until enabled. Times
+include nested calls: an event send includes the draws it causes.
+Triggers are counted before batches merge them, so more triggers than
+sends of an event are the redundant triggers that batches saved.
+summary() returns the counters; with a dump file, the counters of the
+last interval are appended as a JSON line every interval seconds.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import model
+
+
+# calls, seconds, max seconds and subscribers by name
+counters = {}
+# counters at the last dump
+dumped = {}
+originals = []
+dump_file = None
+dump_interval = 10.
+next_dump = 0.
+
+
+def record(name, elapsed, sends=0):
+    counter = counters.get(name)
+    if counter is None:
+        counter = counters[name] = [0, 0., 0., 0]
+    counter[0] += 1
+    counter[1] += elapsed
+    if elapsed > counter[2]:
+        counter[2] = elapsed
+    counter[3] += sends
+    if dump_file is not None and time.perf_counter() >= next_dump:
+        dump()
+
+def timed(name, method):
+    def wrapper(self, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            record(name, time.perf_counter() - start)
+    return wrapper
+
+def timed_draw(method):
+    def wrapper(self, display):
+        start = time.perf_counter()
+        try:
+            return method(self, display)
+        finally:
+            record('draw.'+type(self).__name__, time.perf_counter() - start)
+    return wrapper
+
+def timed_send(method):
+    def wrapper(self, event):
+        start = time.perf_counter()
+        try:
+            method(self, event)
+        finally:
+            record('event.'+event, time.perf_counter() - start, len(self.events[event]))
+    return wrapper
+
+def timed_trigger(method):
+    def wrapper(self, event):
+        start = time.perf_counter()
+        try:
+            method(self, event)
+        finally:
+            record('trigger.'+event, time.perf_counter() - start)
+    return wrapper
+
+def patch(cls, name, wrap):
+    method = cls.__dict__[name]
+    originals.append((cls, name, method))
+    setattr(cls, name, wrap(method))
+
+def enable(ui=False, dump=None, interval=10.):
+    """
+    Start counting, ihm draws too if ui or if ihm is already imported.
+    dump is a file name for JSON lines every interval seconds.
+    """
+    global dump_file, dump_interval, next_dump
+    if originals:
+        return
+    patch(model.EventSource, 'triggerEvent', timed_trigger)
+    patch(model.EventSource, 'send', timed_send)
+    patch(model.ScoreMap, 'score', lambda method: timed('score.ScoreMap', method))
+    patch(model.ScorePath, 'score', lambda method: timed('score.ScorePath', method))
+    patch(model.Paths, 'add', lambda method: timed('paths.add', method))
+    patch(model.Path, 'merge', lambda method: timed('paths.merge', method))
+    if ui or 'ihm' in sys.modules:
+        import ihm
+        for cls in vars(ihm).values():
+            # widgets, Screen.draw calls them
+            if isinstance(cls, type) and cls.__module__ == ihm.__name__ and \
+                    'draw' in cls.__dict__ and cls is not ihm.Screen:
+                patch(cls, 'draw', timed_draw)
+    if dump is not None:
+        dump_file = open(dump, 'a')
+        dump_interval = interval
+        next_dump = time.perf_counter() + interval
+
+def disable():
+    """Put back the original methods, write the last dump line."""
+    global dump_file
+    while originals:
+        cls, name, method = originals.pop()
+        setattr(cls, name, method)
+    if dump_file is not None:
+        write_dump()
+        dump_file.close()
+        dump_file = None
+
+def reset():
+    counters.clear()
+    dumped.clear()
+
+def summary(since=None):
+    """Counters by name, most time first, only what changed after since if given."""
+    result = {}
+    for name, (calls, seconds, longest, sends) in counters.items():
+        if since is not None and name in since:
+            old_calls, old_seconds, _, old_sends = since[name]
+            calls -= old_calls
+            seconds -= old_seconds
+            sends -= old_sends
+        if not calls:
+            continue
+        result[name] = { 'calls': calls, 'time': seconds, 'mean': seconds/calls, 'max': longest }
+        if name.startswith('event.'):
+            result[name]['sends'] = sends
+    return dict(sorted(result.items(), key=lambda item: -item[1]['time']))
+
+def write_dump():
+    line = { 'time': time.time(), 'counters': summary(dumped) }
+    dump_file.write(json.dumps(line) + '\n')
+    dump_file.flush()
+    dumped.clear()
+    dumped.update({ name: list(counter) for name, counter in counters.items() })
+
+def dump():
+    global next_dump
+    write_dump()
+    next_dump = time.perf_counter() + dump_interval
+
+def report(file=sys.stdout):
+    print(f'{"name":24} {"calls":>8} {"sends":>8} {"total ms":>10} {"mean us":>9} {"max us":>9}', file=file)
+    for name, counter in summary().items():
+        print(f'{name:24} {counter["calls"]:8} {counter.get("sends", ""):>8} '
+              f'{counter["time"]*1000:10.2f} {counter["mean"]*1e6:9.1f} {counter["max"]*1e6:9.1f}',
+              file=file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Play with counters of events, scores and draws.')
+    parser.add_argument('--dump', help='JSON lines file of counters')
+    parser.add_argument('--interval', type=float, default=10., help='seconds between dump lines')
+    args = parser.parse_args()
+    enable(ui=True, dump=args.dump, interval=args.interval)
+    import ihm
+    try:
+        ihm.main()
+    finally:
+        disable()
+        report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+Board library: circles and connections of many board images in one
+indexed file, so games load a board by id without OpenCV.
+
+Building detects the circles of each image of a directory in a process
+pool and keeps the boards that pass validation. The file is a header,
+an index of (id, offset, sizes) entries and the data of each board: its
+image path and its circles and connections as unsigned shorts. The id of
+a board is the name of its image without extension.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+from array import array
+from multiprocessing import Pool
+
+import builder
+
+
+MAGIC = b'TRKB'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+# id, data offset, image path length, circles and connections counts
+ENTRY = struct.Struct('<64sQHHI')
+
+IMAGES = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# most circles of a board: values and paths are stored in bytes
+MAX_CIRCLES = 254
+
+LIBRARY = 'boards.lib'
+
+libraries = {}
+
+
+def validate(circles, cnxs, count=None):
+    """Error message for a bad board, None if valid."""
+    if not circles:
+        return 'no circle'
+    if count is not None and len(circles) != count:
+        return f'{len(circles)} circles, expected {count}'
+    if len(circles) > MAX_CIRCLES:
+        return f'{len(circles)} circles, at most {MAX_CIRCLES}'
+    neighbours = [ [] for _ in circles ]
+    for i, j in cnxs:
+        neighbours[i].append(j)
+    for i, (x, y, r) in enumerate(circles):
+        for j in neighbours[i]:
+            x2, y2, _ = circles[j]
+            if (x2-x)*(x2-x) + (y2-y)*(y2-y) < r*r:
+                return f'circles {i} and {j} overlap'
+    # all circles are reachable
+    seen = { 0 }
+    todo = [ 0 ]
+    while todo:
+        for j in neighbours[todo.pop()]:
+            if j not in seen:
+                seen.add(j)
+                todo.append(j)
+    if len(seen) != len(circles):
+        return f'{len(circles)-len(seen)} circles not connected'
+    return None
+
+def detect(args):
+    """(id, image, circles, connections, error) of a board image."""
+    filename, hough, count = args
+    board_id = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        circles = builder.get_circles_scaled(filename, hough)
+    except Exception as e:
+        return board_id, filename, None, None, f'detection failed: {e}'
+    if circles is None:
+        return board_id, filename, None, None, 'no circle'
+    cnxs = builder.get_connections_fast(circles)
+    return board_id, filename, circles, cnxs, validate(circles, cnxs, count)
+
+def images(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if os.path.splitext(name)[1].lower() in IMAGES)
+
+def build(directory, filename=LIBRARY, workers=None, hough=builder.HOUGH, count=None, chunk=8):
+    """
+    Detect boards of the images of directory and write the valid ones
+    to filename. Return (id, error) of the rejected images.
+    """
+    tasks = [ (image, hough, count) for image in images(directory) ]
+    boards = []
+    errors = []
+    with Pool(workers) as pool:
+        for board_id, image, circles, cnxs, error in pool.imap(detect, tasks, chunk):
+            if error is None:
+                boards.append((board_id, image, circles, cnxs))
+            else:
+                errors.append((board_id, error))
+    write(filename, boards)
+    return errors
+
+def write(filename, boards):
+    """Write boards given as (id, image, circles, connections)."""
+    base = os.path.dirname(os.path.abspath(filename))
+    entries = []
+    data = []
+    offset = HEADER.size + ENTRY.size*len(boards)
+    for board_id, image, circles, cnxs in boards:
+        if len(board_id.encode()) > 64:
+            raise ValueError(f'board id {board_id!r} longer than 64 bytes')
+        path = os.path.relpath(os.path.abspath(image), base).encode()
+        # keep board values aligned on shorts
+        path += b'\0'*(len(path) % 2)
+        values = array('H')
+        for circle in circles:
+            values.extend(circle)
+        for cnx in cnxs:
+            values.extend(cnx)
+        entries.append(ENTRY.pack(board_id.encode(), offset, len(path), len(circles), len(cnxs)))
+        data += [ path, values.tobytes() ]
+        offset += len(path) + 2*len(values)
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(boards)))
+        f.writelines(entries)
+        f.writelines(data)
+    os.replace(tmpname, filename)
+
+
+class Library:
+    """Memory-mapped board library, boards read by id on demand."""
+    def __init__(self, filename=LIBRARY):
+        self.filename = filename
+        self.base = os.path.dirname(os.path.abspath(filename))
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f'{filename}: not a board library')
+        if version != VERSION:
+            raise ValueError(f'{filename}: board library version {version}, expected {VERSION}')
+        self.index = {}
+        for board_id, *entry in ENTRY.iter_unpack(self.map[HEADER.size:HEADER.size+ENTRY.size*count]):
+            self.index[board_id.rstrip(b'\0').decode()] = entry
+        self.boards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, board_id):
+        return board_id in self.index
+
+    def ids(self):
+        return list(self.index)
+
+    def image(self, board_id):
+        """Path of the board image."""
+        offset, length, _, _ = self.index[board_id]
+        path = self.map[offset:offset+length].rstrip(b'\0').decode()
+        return os.path.join(self.base, path)
+
+    def get(self, board_id):
+        """Circles and connections of a board, like builder.get_board."""
+        board = self.boards.get(board_id)
+        if board is None:
+            offset, length, n, m = self.index[board_id]
+            values = array('H')
+            values.frombytes(self.map[offset+length:offset+length+2*(3*n+2*m)])
+            circles = [ tuple(values[i:i+3]) for i in range(0, 3*n, 3) ]
+            cnxs = [ tuple(values[i:i+2]) for i in range(3*n, 3*n+2*m, 2) ]
+            board = self.boards[board_id] = circles, cnxs
+        return board
+
+def get_library(filename=None):
+    """Library shared in process, LIBRARY by default."""
+    if filename is None:
+        filename = LIBRARY
+    name = os.path.abspath(filename)
+    if name not in libraries:
+        libraries[name] = Library(filename)
+    return libraries[name]
+
+def get_board(board_id, filename=None):
+    return get_library(filename).get(board_id)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a board library from a directory of images.')
+    parser.add_argument('directory')
+    parser.add_argument('--output', default=LIBRARY)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--count', type=int, help='expected circles of each board')
+    args = parser.parse_args()
+    errors = build(args.directory, args.output, args.workers, count=args.count)
+    for board_id, error in errors:
+        print(f'{board_id}: {error}')
+    print(f'{args.output}: {len(get_library(args.output))} boards, {len(errors)} rejected')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Load test of the game server: many sessions play random moves at once
+over a few connections, and request latencies are measured.
+
+All sessions are created first, then each one plays rounds of check,
+choose and turn. With rooms, the sessions of a room wait for each other
+at the end of a round and one of them asks for a shared roll instead
+of a turn: the roll latency includes the diffs pushed to the room.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+
+class Connection:
+    """Requests matched to their reply by seq number."""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.seq = 0
+        self.waiting = {}
+        self.pushes = 0
+        self.task = asyncio.ensure_future(self.read())
+
+    @classmethod
+    async def open(cls, host='127.0.0.1', port=8765, unix=None):
+        if unix is not None:
+            reader, writer = await asyncio.open_unix_connection(unix, limit=1 << 20)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+        return cls(reader, writer)
+
+    async def read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message.get('push'):
+                self.pushes += 1
+            else:
+                self.waiting.pop(message['seq']).set_result(message)
+
+    async def request(self, message):
+        self.seq += 1
+        message['seq'] = self.seq
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.seq] = future
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        reply = await future
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+
+class Player:
+    def __init__(self, connection, rng, latencies, room=None):
+        self.connection = connection
+        self.rng = rng
+        self.latencies = latencies
+        self.room = room
+        self.id = None
+        self.values = None
+
+    async def request(self, message):
+        start = time.perf_counter()
+        reply = await self.connection.request(message)
+        self.latencies.append(time.perf_counter() - start)
+        for num, value, _ in reply.get('diff', {}).get('circles', ()):
+            self.values[num] = value
+        return reply
+
+    async def start(self):
+        self.values = {}
+        reply = await self.request({ 'op': 'new', 'room': None if self.room is None else self.room.name })
+        self.id = reply['id']
+
+    async def play(self, rounds):
+        for _ in range(rounds):
+            empty = [ num for num, value in self.values.items() if value is None ]
+            if empty:
+                await self.request({ 'op': 'check', 'id': self.id, 'pair': self.rng.randrange(5) })
+                await self.request({ 'op': 'choose', 'id': self.id, 'circle': self.rng.choice(empty) })
+            if self.room is None:
+                await self.request({ 'op': 'turn', 'id': self.id })
+            else:
+                await self.room.roll(self)
+
+
+class Room:
+    def __init__(self, name, size, latencies):
+        self.name = name
+        self.barrier = asyncio.Barrier(size)
+        self.latencies = latencies
+
+    async def roll(self, player):
+        if await self.barrier.wait() == 0:
+            start = time.perf_counter()
+            await player.connection.request({ 'op': 'roll', 'room': self.name })
+            self.latencies.append(time.perf_counter() - start)
+        await self.barrier.wait()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(len(values)*p/100))] if values else 0.
+
+async def run(sessions=10000, connections=100, rounds=5, room_size=0,
+              host='127.0.0.1', port=8765, unix=None, seed=0):
+    """Return (request latencies, roll latencies, elapsed seconds of the rounds, pushes)."""
+    rng = random.Random(seed)
+    links = [ await Connection.open(host, port, unix) for _ in range(connections) ]
+    latencies = []
+    rolls = []
+    rooms = []
+    if room_size:
+        rooms = [ Room(f'room{i}', room_size, rolls) for i in range(sessions//room_size) ]
+    players = [ Player(links[i % connections], random.Random(rng.random()), latencies,
+                       rooms[i // room_size] if rooms else None)
+                for i in range(len(rooms)*room_size if rooms else sessions) ]
+    await asyncio.gather(*(player.start() for player in players))
+    latencies.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(player.play(rounds) for player in players))
+    elapsed = time.perf_counter() - start
+    pushes = sum(link.pushes for link in links)
+    for link in links:
+        await link.close()
+    return latencies, rolls, elapsed, pushes
+
+def report(sessions, latencies, rolls, elapsed, pushes):
+    print(f'{sessions} sessions, {len(latencies)} requests in {elapsed:.2f} s '
+          f'({len(latencies)/elapsed:.0f} requests/s)')
+    print(f'latency p50 {percentile(latencies, 50)*1000:.2f} ms, '
+          f'p99 {percentile(latencies, 99)*1000:.2f} ms')
+    if rolls:
+        print(f'{len(rolls)} rolls, {pushes} pushes, roll latency p50 '
+              f'{percentile(rolls, 50)*1000:.2f} ms, p99 {percentile(rolls, 99)*1000:.2f} ms')
+
+def spawn(unix=None):
+    """Start a server process, return it and its (host, port)."""
+    command = [ sys.executable, 'server.py' ] + ([ '--unix', unix ] if unix else [ '--port', '0' ])
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    address = process.stdout.readline().split()[-1]
+    if unix:
+        return process, (None, None)
+    host, _, port = address.rpartition(':')
+    return process, (host, int(port))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--connections', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--room-size', type=int, default=0, help='sessions sharing rolls, 0 for none')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='unix socket path, instead of TCP')
+    parser.add_argument('--spawn', action='store_true', help='start a server process')
+    args = parser.parse_args()
+    process = None
+    if args.spawn:
+        process, (host, port) = spawn(args.unix)
+        if not args.unix:
+            args.host, args.port = host, port
+    try:
+        result = asyncio.run(run(args.sessions, args.connections, args.rounds, args.room_size,
+                                 args.host, args.port, args.unix))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    report(args.sessions, *result)
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,84 @@
 import random
+from collections import deque, namedtuple
+from contextlib import contextmanager
 from enum import IntEnum
 
 import builder
 
 
 class EventSource:
+    __slots__ = ('events',)
+
+    # events waiting for the end of a batch, by source and event
+    pending = None
+
     def __init__(self):
         self.events = {}
         
     def triggerEvent(self, event):
         if event not in self.events:
             return
+        if EventSource.pending is not None:
+            EventSource.pending.setdefault((id(self), event), (self, event))
+            return
+        self.send(event)
+
+    def send(self, event):
+        """Call the subscribers of event now."""
         for send in self.events[event]:
             send()
 
+    @staticmethod
+    @contextmanager
+    def batch():
+        """
+        Delay events until the end of the batch, then send each
+        (source, event) once in the order they first occurred.
+        Events triggered while sending are batched the same way.
+        The batch is shared by all sources, whatever class it is called on.
+        """
+        if EventSource.pending is not None:
+            # nested batch, sent by the outer one
+            yield
+            return
+        EventSource.pending = {}
+        try:
+            yield
+        finally:
+            try:
+                pending = EventSource.pending
+                while pending:
+                    source, event = pending.pop(next(iter(pending)))
+                    source.send(event)
+            finally:
+                EventSource.pending = None
+
     def subscribe(self, when, send):
         if when not in self.events:
             self.events[when] = []
         self.events[when].append(send)
 
+    def emit(self, kind, *fields):
+        """Send a delta to the 'delta' subscribers now, never batched."""
+        sends = self.events.get('delta')
+        if sends:
+            delta = kind(*fields)
+            for send in sends:
+                send(delta)
+
+
+# deltas sent with the changes, in order, to send(delta) subscribers of 'delta'
+CircleValue = namedtuple('CircleValue', 'num value')
+CircleMapped = namedtuple('CircleMapped', 'num mapped')
+# Paths.add of 2 circles: new path, added circle or merge
+PathAdd = namedtuple('PathAdd', 'new num')
+ChoiceCheck = namedtuple('ChoiceCheck', 'pair')
+DicesValue = namedtuple('DicesValue', 'red yellow')
+# current circle and value of the game
+Selection = namedtuple('Selection', 'num value')
+# whole state replaced by Game.restore
+Restore = namedtuple('Restore', 'snapshot')
+
 
 class Dice(EventSource):
     def __init__(self, max=6, min=1):
@@ -32,6 +92,13 @@ class Dice(EventSource):
         self.triggerEvent('update')
         return self.value
 
+    def set(self, value):
+        """Value thrown elsewhere."""
+        if not self.min <= value <= self.max:
+            raise ValueError(f'dice value {value} not in {self.min}..{self.max}')
+        self.value = value
+        self.triggerEvent('update')
+
 
 class Pair(IntEnum):
     """Type of availabel dice pairs."""
@@ -41,6 +108,15 @@ class Pair(IntEnum):
     Add = 3
     Mul = 4
 
+def pair_values(r, y):
+    """Values of each Pair for red and yellow dice values."""
+    return (min(r,y), max(r,y), max(r,y)-min(r,y), r+y, r*y)
+
+# pair values by red (1 to 6) and yellow (0 to 5) dice values,
+# PAIR_TABLE[red-1][yellow][pair]
+PAIR_TABLE = tuple(tuple(pair_values(red, yellow) for yellow in range(0, 6))
+                   for red in range(1, 7))
+
 class Dices(EventSource):
     def __init__(self):
         super().__init__()
@@ -50,27 +126,39 @@ class Dices(EventSource):
         self.yellow.subscribe('update', self.update)
 
     def throw(self):
-        self.red.throw()
-        self.yellow.throw()
+        if 'update' in self.events:
+            # one update for both dices
+            with EventSource.batch():
+                self.red.throw()
+                self.yellow.throw()
+        else:
+            self.red.throw()
+            self.yellow.throw()
+        self.emit(DicesValue, self.red.value, self.yellow.value)
+
+    def set(self, red, yellow):
+        if 'update' in self.events:
+            with EventSource.batch():
+                self.red.set(red)
+                self.yellow.set(yellow)
+        else:
+            self.red.set(red)
+            self.yellow.set(yellow)
+        self.emit(DicesValue, red, yellow)
 
     def update(self):
         self.triggerEvent('update')
 
     def pairing(self):
-        pairs = {}
+        """Values indexed by Pair, None if not thrown."""
         r = self.red.value
         y = self.yellow.value
         if r is None or y is None:
             return None
-        pairs[Pair.Min] = min(r,y)
-        pairs[Pair.Max] = max(r,y)
-        pairs[Pair.Neg] = max(r,y)-min(r,y)
-        pairs[Pair.Add] = r+y
-        pairs[Pair.Mul] = r*y
-        return pairs
+        return PAIR_TABLE[r-1][y]
 
     def value(self, pair):
-        return self.pairing()[pair]
+        return PAIR_TABLE[self.red.value-1][self.yellow.value][pair]
 
 class Choices(EventSource):
     def __init__(self):
@@ -88,82 +176,207 @@ class Choices(EventSource):
     def check(self, pair):
         self.choices[pair] += 1
         self.triggerEvent('update')
+        self.emit(ChoiceCheck, pair)
 
 debug = False
 
+# empty circle or no path in byte arrays
+NONE = 255
+
+# neighbours and neighbour masks by board connections, shared by games
+adjacencies = {}
+
+def get_adjacency(count, cnxs):
+    # lists by their pairs, shared views by themselves
+    key = (count, tuple(cnxs) if isinstance(cnxs, list) else cnxs)
+    if key not in adjacencies:
+        neighbours = [ [] for _ in range(count) ]
+        masks = [0]*count
+        for i, j in cnxs:
+            neighbours[i].append(j)
+            masks[i] |= 1 << j
+        adjacencies[key] = tuple(tuple(nums) for nums in neighbours), tuple(masks)
+    return adjacencies[key]
+
+def bits(mask):
+    """Numbers of the bits set in mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length()-1
+        mask ^= low
+
+def bit_count(mask):
+    return bin(mask).count('1')
+
 class Circle(EventSource):
-    def __init__(self, num):
+    """View on a circle of the Circles arrays."""
+    __slots__ = ('num', 'board', 'cnxs')
+
+    def __init__(self, num, board, cnxs=()):
         global debug
         super().__init__()
         self.num = num
+        self.board = board
+        self.cnxs = cnxs
         if debug:
-            self.__value = num
-        else:
-            self.__value = None
-        self.cnxs = []
-        self.__mapped = False
+            board.values[num] = num
 
     def __repr__(self):
         return f'C{self.num}:{"/" if self.value is None else self.value}'
 
     def add_cnx(self, i):
-        self.cnxs.append(i)
+        self.cnxs = self.cnxs + (i,)
+        self.board.masks[self.num] |= 1 << i
         
     def is_connected(self, i):
-        return i in self.cnxs
+        return bool(self.board.masks[self.num] >> i & 1)
 
     def getvalue(self):
-        return self.__value
+        value = self.board.values[self.num]
+        return None if value == NONE else value
 
     def setvalue(self, value):
-        self.__value = value
+        self.board.occupy(self.num, NONE if value is None else value)
         self.triggerEvent('update')
+        self.emit(CircleValue, self.num, value)
 
     value=property(getvalue, setvalue)
     
     def getmapped(self):
-        return self.__mapped
+        return bool(self.board.mapped[self.num])
     
     def setmapped(self, mapped):
-        self.__mapped = mapped
+        self.board.mapped[self.num] = mapped
         self.triggerEvent('update')
+        self.emit(CircleMapped, self.num, bool(mapped))
 
     mapped=property(getmapped, setmapped)
 
 
 class Circles:
-    def __init__(self):
+    """
+    Circle values and mapped flags in byte arrays (NONE for no value),
+    neighbours shared by all games on the same board.
+    Bit boards: masks are the neighbours of each circle, occupancy the
+    circles of each value.
+    """
+    def __init__(self, board=None):
         super().__init__()
-        circles = builder.get_circles('dunai.jpg')
-        cnxs = builder.get_connections(circles)
-        self.circles = [Circle(i) for i in range(len(circles))]
-        for i,j in cnxs:
-             self.circles[i].add_cnx(j)
+        self.image = builder.board_image(board)
+        circles, cnxs = builder.load_board(board)
+        # (x, y, radius) of each circle, for views
+        self.geometry = circles
+        count = len(circles)
+        self.values = bytearray([NONE])*count
+        self.mapped = bytearray(count)
+        neighbours, masks = get_adjacency(count, cnxs)
+        self.masks = list(masks)
+        self.circles = [Circle(i, self, neighbours[i]) for i in range(count)]
+        self.reoccupy()
 
     def __getitem__(self, i):
         return self.circles[i]
 
+    def occupy(self, num, value):
+        old = self.values[num]
+        if old != NONE:
+            self.occupancy[old] &= ~(1 << num)
+        if value != NONE:
+            self.occupancy[value] = self.occupancy.get(value, 0) | 1 << num
+        self.values[num] = value
+
+    def reoccupy(self):
+        """Compute again occupancy from values."""
+        self.occupancy = {}
+        for num, value in enumerate(self.values):
+            if value != NONE:
+                self.occupancy[value] = self.occupancy.get(value, 0) | 1 << num
+
+    def same(self, num, value):
+        """Mask of the neighbours of circle num with value."""
+        return self.masks[num] & self.occupancy.get(value, 0)
+
+    def group(self, num):
+        """Mask of the circles connected to num with the same value."""
+        occupied = self.occupancy.get(self.values[num], 0)
+        group = 1 << num
+        frontier = group
+        while frontier:
+            reach = 0
+            for other in bits(frontier):
+                reach |= self.masks[other]
+            frontier = reach & occupied & ~group
+            group |= frontier
+        return group
+
+
+def value_key(circle):
+    """Circle order in paths: empty circles first, then by value and number."""
+    return (-1 if circle.value is None else circle.value, circle.num)
 
 class Path(EventSource):
+    """
+    Circles of a path, sorted by value when read.
+    'top' is the circle with the highest value, the end of the path. It
+    is kept up to date by changed() when circles of the path get a value
+    after they are in the path.
+    """
     def __init__(self, *path):
         super().__init__()
-        self.path = [ *path ]
-        self.sort()
-
-    def sort(self):
-        self.path.sort(key=lambda circle: circle.value)
+        self.circles = []
+        self.members = set()
+        self.sorted = True
+        self.top = None
+        # value_key of top when it became the top
+        self.top_key = None
+        for circle in path:
+            self.append(circle)
+
+    def __len__(self):
+        return len(self.circles)
+
+    def getpath(self):
+        if not self.sorted:
+            self.circles.sort(key=value_key)
+            self.sorted = True
+        return self.circles
+
+    path = property(getpath)
+
+    def set_top(self, circle):
+        self.top = circle
+        self.top_key = value_key(circle)
+
+    def append(self, circle):
+        self.circles.append(circle)
+        self.members.add(circle)
+        self.sorted = False
+        if self.top is None or value_key(circle) > self.top_key:
+            self.set_top(circle)
+
+    def changed(self, circle):
+        """Circle of the path got a new value."""
+        self.sorted = False
+        key = value_key(circle)
+        if circle is not self.top:
+            if key > self.top_key:
+                self.set_top(circle)
+        elif key >= self.top_key:
+            self.top_key = key
+        else:
+            # overwritten top
+            self.set_top(max(self.circles, key=value_key))
 
     def exists(self, circle):
-        return circle in self.path
+        return circle in self.members
 
     def add(self, new_circle, circle):
-        self.path.append(new_circle)
-        self.sort()
+        self.append(new_circle)
         self.triggerEvent('update')
 
     def merge(self, path):
-        self.path += path.path
-        self.sort()
+        for circle in path.circles:
+            self.append(circle)
         self.triggerEvent('update')
 
 
@@ -171,35 +384,58 @@ class Paths(EventSource):
     def __init__(self):
         super().__init__()
         self.paths = []
+        # path of each circle
+        self.index = {}
+        # circles whose value updates are sent to their path
+        self.watched = set()
 
     def exists(self, circle):
-        for path in self.paths:
-            if path.exists(circle):
-                return path
-        return None
+        return self.index.get(circle)
+
+    def watch(self, circle):
+        if circle not in self.watched:
+            self.watched.add(circle)
+            circle.subscribe('update', lambda: self.changed(circle))
+
+    def changed(self, circle):
+        path = self.index.get(circle)
+        if path is not None:
+            path.changed(circle)
 
     def add(self, new_circle, circle):
         """
         Add path on 2 circles, new if the new added circle.
         'circle' could be an existing or a new.
         """
-        existing = self.exists(new_circle)
-        for path in self.paths:
-            if path.exists(circle):
-                if existing is None:
-                    path.add(new_circle, circle)
-                else:
-                    existing.merge(path)
-                    self.paths.remove(path)
-                self.triggerEvent('update')
-                return
-        if existing is not None:
-            path = Path(circle)
-            existing.merge(path)
+        existing = self.index.get(new_circle)
+        path = self.index.get(circle)
+        if new_circle is circle:
+            # not a segment
+            pass
+        elif path is not None:
+            if existing is None:
+                path.add(new_circle, circle)
+                self.index[new_circle] = path
+            elif existing is not path:
+                # merge the smaller path in the bigger one
+                if len(existing) < len(path):
+                    existing, path = path, existing
+                existing.merge(path)
+                for moved in path.circles:
+                    self.index[moved] = existing
+                self.paths.remove(path)
+        elif existing is not None:
+            existing.add(circle, new_circle)
+            self.index[circle] = existing
         else:
             path = Path(new_circle, circle)
             self.paths.append(path)
+            self.index[new_circle] = path
+            self.index[circle] = path
+        self.watch(new_circle)
+        self.watch(circle)
         self.triggerEvent('update')
+        self.emit(PathAdd, new_circle.num, circle.num)
 
 
 class Score(EventSource):
@@ -226,13 +462,16 @@ class ScorePath(Score):
         self.paths.subscribe('update', self.update)
 
     def score_for(self, path):
-        path = path.path
-        if path[-1].value is None:
+        if path.top.value is None:
             return None
-        return path[-1].value+len(path)-1, len(path)
+        return path.top.value+len(path)-1, len(path)
 
     def score(self):
+        # paths of empty circles have no score yet
         points_sizes = [ self.score_for(path) for path in self.paths.paths ]
+        points_sizes = [ point_size for point_size in points_sizes if point_size is not None ]
+        if not points_sizes:
+            return (), 0, 0
         points,sizes = list(zip(*points_sizes))
         max_size = max(sizes)
         bonus = self.bonus_for(max_size)
@@ -240,58 +479,104 @@ class ScorePath(Score):
 
 
 class ScoreMap(Score):
+    """
+    Score of maps, the groups of connected circles with the same value.
+    Groups are kept in a disjoint-set updated when a circle value is set.
+    """
     def __init__(self, circles):
         super().__init__()
         self.circles = circles
+        count = len(circles.circles)
+        self.values = [None]*count
+        self.parent = list(range(count))
+        self.size = [1]*count
+        self.low = list(range(count))
+        # roots of groups with at least 2 circles
+        self.groups = set()
+        self.max_size = 0
+        for circle in circles.circles:
+            circle.subscribe('update', lambda circle=circle: self.place(circle))
+            if circle.value is not None:
+                self.place(circle)
+
+    def find(self, num):
+        parent = self.parent
+        while parent[num] != num:
+            parent[num] = parent[parent[num]]
+            num = parent[num]
+        return num
+
+    def union(self, num1, num2):
+        root1 = self.find(num1)
+        root2 = self.find(num2)
+        if root1 == root2:
+            return
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+        self.low[root1] = min(self.low[root1], self.low[root2])
+        self.groups.discard(root2)
+        self.groups.add(root1)
+        self.max_size = max(self.max_size, self.size[root1])
+
+    def join(self, num):
+        for other in bits(self.circles.same(num, self.values[num])):
+            self.union(num, other)
+
+    def rebuild(self):
+        count = len(self.values)
+        self.parent = list(range(count))
+        self.size = [1]*count
+        self.low = list(range(count))
+        self.groups = set()
+        self.max_size = 0
+        done = 0
+        for num, value in enumerate(self.values):
+            if value is None or done >> num & 1:
+                continue
+            # flood fill, num is the lowest circle of its group
+            group = self.circles.group(num)
+            done |= group
+            for other in bits(group):
+                self.parent[other] = num
+            size = bit_count(group)
+            self.size[num] = size
+            if size >= 2:
+                self.groups.add(num)
+                self.max_size = max(self.max_size, size)
+
+    def reload(self):
+        """Read again all circle values."""
+        self.values = [ circle.value for circle in self.circles.circles ]
+        self.rebuild()
+
+    def place(self, circle):
+        num = circle.num
+        old = self.values[num]
+        if circle.value == old:
+            return
+        self.values[num] = circle.value
+        if old is None:
+            self.join(num)
+        else:
+            # a changed value can split a group
+            self.rebuild()
 
     def score(self):
-        maps = []
-        # check all circles
-        for circle in self.circles:
-            # check only circle with value
-            if circle.value is None:
-                continue
-            # check if a circle is linked to a map
-            first_map = None
-            for amap in maps:
-                if circle.value == amap['value']:
-                    # the circle could be in this map
-                    # check if connected to an other circle
-                    for other in amap['list']:
-                        if other.is_connected(circle.num):
-                            # it is connected, add or merge
-                            if first_map is None:
-                                # add to map if not in first one
-                                amap['list'].append(circle)
-                                first_map = amap
-                            else:
-                                # circle is in first and map => merge
-                                first_map['list'] += amap['list']
-                                maps.remove(amap)
-                            break
-            # check if circle should add
-            if first_map is None:
-                # not added yet, so create a new map
-                maps.append({ 'value': circle.value, 'list':[ circle ] })
-        points = []
-        max_size = 0
-        for amap in maps:
-            size = len(amap['list'])
-            if size<=1:
-                # keep only with min 2 circles
-                continue
-            points.append(amap['value']+size-1)
-            max_size = max(max_size, size)
-        bonus = self.bonus_for(max_size)
+        # maps ordered by their first circle
+        maps = sorted((self.low[root], root) for root in self.groups)
+        points = [ self.values[root]+self.size[root]-1 for _,root in maps ]
+        bonus = self.bonus_for(self.max_size)
         return points, bonus, sum(points)+bonus
 
 
-class Game:
-    def __init__(self):
+class Game(EventSource):
+    def __init__(self, board=None, history=0, log=None):
         super().__init__()
         self.dices = Dices()
         self.choices = Choices()
-        self.circles = Circles()
+        self.circles = Circles(board)
         self.paths = Paths()
         self.score_path = ScorePath(self.paths)
         self.score_maps = ScoreMap(self.circles)
@@ -300,45 +585,156 @@ class Game:
         self.value = None
         self.circle = None
 
+        # snapshots before each check and choose, for undo
+        self.history_size = history
+        self.history = deque(maxlen=history)
+
+        # gamelog.Recorder of turn, check and choose calls
+        if log is not None and history:
+            raise ValueError('undo is not recorded in game logs, use history or log')
+        self.log = log
+        self.log_game = None if log is None else log.start()
+
         self.turn()
     
-    def turn(self):
-        self.dices.throw()
+    def turn(self, red=None, yellow=None):
+        """Throw dices, or use red and yellow values thrown for all players."""
+        if red is None:
+            self.dices.throw()
+        else:
+            self.dices.set(red, yellow)
         self.value = None
         self.circle = None
+        self.selected()
+        if self.log is not None:
+            self.log.turn(self.log_game, self.dices.red.value, self.dices.yellow.value)
 
     def check(self, pair):
-        self.choices.check(pair)
-        self.value = self.dices.value(pair)
-        self.update()
+        if self.log is not None:
+            self.log.check(self.log_game, pair)
+        if self.history_size:
+            self.history.append(self.snapshot())
+        with EventSource.batch():
+            self.choices.check(pair)
+            self.value = self.dices.value(pair)
+            self.selected()
+            self.update()
         
     def choose(self, num):
-        if self.circle is None:
-            self.circle = self.circles[num]
-            self.update()
-        else:
-            current = self.circle
-            self.paths.add(current, self.circles[num])
+        if self.log is not None:
+            self.log.choose(self.log_game, num)
+        if self.history_size:
+            self.history.append(self.snapshot())
+        with EventSource.batch():
+            if self.circle is None:
+                self.circle = self.circles[num]
+                self.selected()
+                self.update()
+            else:
+                current = self.circle
+                self.paths.add(current, self.circles[num])
+
+    def selected(self):
+        self.emit(Selection, None if self.circle is None else self.circle.num, self.value)
 
     def update(self):
         if self.value is None: return
         if self.circle is None: return
         current = self.circle
         current.value = self.value
+        if self.paths.exists(current):
+            # the value may change the top of its path
+            self.score_path.update()
         # check mapping if not already done
         if not current.mapped:
-            for num in current.cnxs:
-                circle = self.circles[num]
-                if circle.value==self.value:
-                    current.mapped = True
-                    circle.mapped = True
-                    self.score_maps.update()
-
-game = Game()
-game.circles[15].value = 5
-game.circles[16].value = 5
-game.circles[0].value = 5
-game.circles[8].value = 5
-#game.circle = game.circles[0]
-#game.paths.add(game.circles[15],game.circles[16])
-game.score_maps.score()
+            same = self.circles.same(current.num, self.value)
+            if same:
+                current.mapped = True
+                for num in bits(same):
+                    self.circles[num].mapped = True
+                self.score_maps.update()
+
+    def snapshot(self):
+        """
+        Game state as bytes: circle values, mapped flags, path of each
+        circle (its lowest circle number), paths order, choices, current
+        circle and value, and dices.
+        """
+        circles = self.circles
+        count = len(circles.values)
+        parents = bytearray([NONE])*count
+        order = bytearray([NONE])*count
+        for i, path in enumerate(self.paths.paths):
+            root = min(circle.num for circle in path.circles)
+            order[i] = root
+            for circle in path.circles:
+                parents[circle.num] = root
+        choices = bytes(self.choices.count(pair) for pair in Pair)
+        current = bytes(NONE if value is None else value for value in
+                        (None if self.circle is None else self.circle.num, self.value,
+                         self.dices.red.value, self.dices.yellow.value))
+        return b''.join((circles.values, circles.mapped, parents, order, choices, current))
+
+    def restore(self, snapshot):
+        """Go back to a snapshot state, sending updates for what changed."""
+        circles = self.circles
+        count = len(circles.values)
+        if len(snapshot) != 4*count+len(Pair)+4:
+            raise ValueError(f'snapshot of {len(snapshot)} bytes, not of this board')
+        values = snapshot[:count]
+        mapped = snapshot[count:2*count]
+        parents = snapshot[2*count:3*count]
+        order = snapshot[3*count:4*count]
+        choices = snapshot[4*count:4*count+len(Pair)]
+        num, value, red, yellow = [ None if byte == NONE else byte
+                                    for byte in snapshot[4*count+len(Pair):] ]
+        with EventSource.batch():
+            changed = [ circle for circle in circles.circles
+                        if values[circle.num] != circles.values[circle.num]
+                        or mapped[circle.num] != circles.mapped[circle.num] ]
+            circles.values[:] = values
+            circles.mapped[:] = mapped
+            circles.reoccupy()
+            self.score_maps.reload()
+            for circle in changed:
+                circle.triggerEvent('update')
+            paths = []
+            index = {}
+            for root in order:
+                if root == NONE:
+                    break
+                path = Path(*[ circle for circle in circles.circles if parents[circle.num] == root ])
+                paths.append(path)
+                for circle in path.circles:
+                    index[circle] = path
+                    self.paths.watch(circle)
+            self.paths.paths = paths
+            self.paths.index = index
+            self.paths.triggerEvent('update')
+            if list(choices) != [ self.choices.count(pair) for pair in Pair ]:
+                for pair in Pair:
+                    self.choices.choices[pair] = choices[pair]
+                self.choices.triggerEvent('update')
+            for dice, dice_value in ((self.dices.red, red), (self.dices.yellow, yellow)):
+                if dice.value != dice_value:
+                    dice.value = dice_value
+                    dice.triggerEvent('update')
+            self.circle = None if num is None else circles[num]
+            self.value = value
+        self.emit(Restore, bytes(snapshot))
+
+    def undo(self):
+        """Cancel the last check or choose, False if nothing to undo."""
+        if not self.history:
+            return False
+        self.restore(self.history.pop())
+        return True
+
+game = None
+
+def get_game():
+    """Shared game, created on first use."""
+    global game
+    if game is None:
+        game = Game()
+    return game
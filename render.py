@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Offscreen rendering of game states to PNG images, without a window.
+
+A Renderer restores a state in its own model.Game and draws it with the
+ihm widgets on a pygame Surface, from the background up. The background
+image is decoded once per process. export() saves states in a process
+pool, one Renderer per worker; the script renders the last state of
+each game of game logs.
+"""
+
+import argparse
+import os
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from multiprocessing import get_context
+
+import numpy as np
+import pygame
+
+import gamelog
+import ihm
+import model
+
+
+backgrounds = {}
+
+# Renderer of a pool worker
+renderer = None
+
+
+def get_background(image):
+    """Decoded board image, shared in process."""
+    if image not in backgrounds:
+        backgrounds[image] = pygame.image.load(image)
+    return backgrounds[image]
+
+def png(surface, level=3):
+    """
+    PNG bytes of a surface. Rows are Up filtered and compressed with a
+    low zlib level: 4 times faster than pygame.image.save for the same size.
+    """
+    width, height = surface.get_size()
+    pixels = np.frombuffer(pygame.image.tobytes(surface, 'RGB'), np.uint8).reshape(height, 3*width)
+    rows = np.empty((height, 3*width+1), np.uint8)
+    rows[:, 0] = 2
+    rows[0, 1:] = pixels[0]
+    np.subtract(pixels[1:], pixels[:-1], out=rows[1:, 1:])
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + \
+               struct.pack('>I', zlib.crc32(kind + data))
+    return b''.join((b'\x89PNG\r\n\x1a\n',
+                     chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+                     chunk(b'IDAT', zlib.compress(rows.tobytes(), level)),
+                     chunk(b'IEND', b'')))
+
+@contextmanager
+def offscreen(background):
+    """Widgets draw with background and do not draw on a live window screen."""
+    saved = ihm.screen, ihm.background
+    ihm.screen, ihm.background = None, background
+    try:
+        yield
+    finally:
+        ihm.screen, ihm.background = saved
+
+
+class Renderer:
+    """ihm widgets of a game drawn on a surface the size of the window."""
+    def __init__(self, board=None):
+        self.game = game = model.Game(board)
+        self.background = get_background(game.circles.image)
+        self.surface = pygame.Surface(ihm.Window.size)
+        with offscreen(self.background):
+            circles = ihm.Circles(game.circles)
+            # drawn in the order of Window
+            self.widgets = [ circles, ihm.Values(game.dices), ihm.Dices(game.dices),
+                             ihm.Paths(game.paths, circles.circles), ihm.Choices(game.choices),
+                             ihm.ScorePath(game.score_path), ihm.ScoreMaps(game.score_maps) ]
+
+    def render(self, state):
+        """
+        Surface of a state: a model.Game, a gamelog.Replay or snapshot
+        bytes. The surface is drawn again by the next render.
+        """
+        snapshot = state if isinstance(state, (bytes, bytearray)) else state.snapshot()
+        with offscreen(self.background):
+            self.game.restore(snapshot)
+            self.surface.blit(self.background, (0, 0))
+            for widget in self.widgets:
+                widget.draw(self.surface)
+        return self.surface
+
+    def save(self, state, filename):
+        with open(filename, 'wb') as f:
+            f.write(png(self.render(state)))
+
+
+def start_worker(board):
+    global renderer
+    renderer = Renderer(board)
+
+def save_image(task):
+    filename, snapshot = task
+    renderer.save(snapshot, filename)
+    return filename
+
+def export(states, directory, board=None, workers=None, chunk=16):
+    """
+    Save (name, state) pairs to directory/name.png in a process pool.
+    Return the file names and images per second.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tasks = [ (os.path.join(directory, name + '.png'),
+               state if isinstance(state, (bytes, bytearray)) else state.snapshot())
+              for name, state in states ]
+    start = time.perf_counter()
+    # workers forked after SDL started its threads could wait on its locks
+    with get_context('spawn').Pool(workers, start_worker, (board,)) as pool:
+        filenames = list(pool.imap(save_image, tasks, chunk))
+    return filenames, len(filenames)/(time.perf_counter() - start)
+
+def log_states(filename, board=None):
+    """(name, snapshot) of the last state of each game of a game log."""
+    log = gamelog.GameLog(filename, board)
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        return [ (f'{stem}-{game}', state.snapshot()) for game, state in log.replay() ]
+    finally:
+        log.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the games of game logs to PNG images.')
+    parser.add_argument('filenames', nargs='+')
+    parser.add_argument('--output', default='images')
+    parser.add_argument('--board', help='board library id, default image board if none')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    states = []
+    for filename in args.filenames:
+        states += log_states(filename, args.board)
+    filenames, speed = export(states, args.output, args.board, args.workers)
+    print(f'{len(filenames)} images in {args.output}, {speed:.0f} images/s')
+
+if __name__ == "__main__":
+    main()
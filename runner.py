@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Play many random games on all cores with the headless engine.
+
+Games run by chunks. The dice of each game are drawn at once from a
+numpy generator seeded with the run seed and the game number, and its
+moves use a seed derived from them too. Chunk results are merged in
+order, so results depend neither on the number of workers nor on the
+chunk size.
+"""
+
+import argparse
+import os
+import random
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+
+import builder
+import sim
+
+
+class Stats:
+    """Streaming count, mean, variance and histogram of scores."""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.histogram = Counter()
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(value - self.mean)
+        self.histogram[value] += 1
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta*other.count/count
+        self.m2 += other.m2 + delta*delta*self.count*other.count/count
+        self.count = count
+        self.histogram.update(other.histogram)
+
+    def variance(self):
+        if self.count < 2:
+            return 0.
+        return self.m2/(self.count-1)
+
+    def __repr__(self):
+        return f'n={self.count} mean={self.mean:.3f} var={self.variance():.3f}'
+
+
+def game_rng(seed, index):
+    return random.Random(f'{seed}:{index}')
+
+def run_chunk(args):
+    board, seed, start, stop = args
+    engine = sim.Sim(board)
+    maps = Stats()
+    paths = Stats()
+    # a game throws once per filled circle, and once at start
+    turns = len(engine.neighbours)+1
+    for index in range(start, stop):
+        red, yellow, _ = sim.throw_batch(1, np.random.default_rng([seed, index]), turns)
+        engine.rng = game_rng(seed, index)
+        engine.use_rolls(red[0].tolist(), yellow[0].tolist())
+        map_total, path_total = sim.play(engine, engine.rng)
+        maps.add(map_total)
+        paths.add(path_total)
+    return maps, paths
+
+def merge(results):
+    maps = Stats()
+    paths = Stats()
+    for chunk_maps, chunk_paths in results:
+        maps.merge(chunk_maps)
+        paths.merge(chunk_paths)
+    return maps, paths
+
+def run(games, workers=None, seed=0, chunk=1000, board=None):
+    """Play games, return (map totals, path totals) Stats."""
+    board = builder.load_board(board)
+    chunks = [ (board, seed, start, min(start+chunk, games))
+               for start in range(0, games, chunk) ]
+    if workers == 1:
+        return merge(map(run_chunk, chunks))
+    with Pool(workers) as pool:
+        # ordered results, so merges happen in the same order
+        return merge(pool.imap(run_chunk, chunks))
+
+def print_histogram(stats, width=50):
+    if not stats.histogram:
+        return
+    top = max(stats.histogram.values())
+    for value in sorted(stats.histogram):
+        count = stats.histogram[value]
+        print(f'{value:5} {count:8} {"#"*max(1, count*width//top)}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk', type=int, default=1000, help='games per task')
+    parser.add_argument('--histogram', action='store_true')
+    args = parser.parse_args()
+    maps, paths = run(args.games, args.workers, args.seed, args.chunk)
+    for name, stats in (('map', maps), ('path', paths)):
+        print(f'{name}: {stats}')
+        if args.histogram:
+            print_histogram(stats)
+
+if __name__ == "__main__":
+    main()
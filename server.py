@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Game server: many independent games in one asyncio process.
+
+Clients send JSON lines over TCP or a unix socket, each one may drive
+many sessions:
+    {"op": "new", "board": id, "room": name}     new session, full state
+    {"op": "turn" | "check" | "choose", "id": session, "pair" | "circle": n}
+    {"op": "join", "id": session, "room": name}  share the dices of a room
+    {"op": "roll", "room": name}                 one throw for all the room
+    {"op": "close", "id": session}
+Requests may carry a "seq" number, copied in the reply. Replies of
+session requests hold the diff of what the request changed, collected
+from the game events. A roll pushes the diff of each session of the
+room to the connection of that session, with "push": true.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import builder
+import model
+
+
+class Session:
+    """A game and what its events changed since the last diff."""
+    def __init__(self, sid, board, writer=None):
+        self.id = sid
+        self.writer = writer
+        self.room = None
+        self.game = model.Game(board)
+        game = self.game
+        self.circles = set()
+        self.changed = set()
+        for circle in game.circles.circles:
+            circle.subscribe('update', lambda num=circle.num: self.circles.add(num))
+        game.dices.subscribe('update', lambda: self.changed.add('dices'))
+        game.choices.subscribe('update', lambda: self.changed.add('choices'))
+        game.paths.subscribe('update', lambda: self.changed.add('paths'))
+        self.scores = None
+
+    def handle(self, message):
+        op = message['op']
+        if op == 'turn':
+            self.game.turn()
+        elif op == 'check':
+            self.game.check(model.Pair(message['pair']))
+        elif op == 'choose':
+            num = message['circle']
+            if not 0 <= num < len(self.game.circles.circles):
+                raise ValueError(f'no circle {num}')
+            self.game.choose(num)
+        else:
+            raise ValueError(f'unknown operation {op!r}')
+        return self.diff()
+
+    def diff(self):
+        game = self.game
+        diff = {}
+        if self.circles:
+            diff['circles'] = [ [ num, game.circles[num].value, game.circles[num].mapped ]
+                                for num in sorted(self.circles) ]
+            self.circles.clear()
+        if 'dices' in self.changed:
+            diff['dices'] = [ game.dices.red.value, game.dices.yellow.value ]
+        if 'choices' in self.changed:
+            diff['choices'] = [ game.choices.count(pair) for pair in model.Pair ]
+        if 'paths' in self.changed:
+            diff['paths'] = [ [ circle.num for circle in path.path ] for path in game.paths.paths ]
+        self.changed.clear()
+        scores = [ list(game.score_maps.score()), list(game.score_path.score()) ]
+        if scores != self.scores:
+            diff['scores'] = self.scores = scores
+        return diff
+
+    def state(self):
+        """Full state, the diff from a new game."""
+        game = self.game
+        self.circles.update(range(len(game.circles.circles)))
+        self.changed.update(('dices', 'choices', 'paths'))
+        self.scores = None
+        return self.diff()
+
+
+class Server:
+    def __init__(self, board=None, seed=None):
+        self.board = builder.load_board(board)
+        self.sessions = {}
+        self.rooms = {}
+        self.next_id = 0
+        self.rng = random.Random(seed)
+        self.requests = 0
+
+    def new(self, message, writer):
+        board = message.get('board')
+        if board is not None and not isinstance(board, str):
+            raise ValueError(f'board {board!r} is not a library id')
+        session = Session(self.next_id, self.board if board is None else board, writer)
+        self.next_id += 1
+        self.sessions[session.id] = session
+        if message.get('room') is not None:
+            self.join(session, message['room'])
+        return { 'id': session.id, 'diff': session.state() }
+
+    def join(self, session, room):
+        if session.room is not None:
+            self.rooms[session.room].discard(session)
+        session.room = room
+        self.rooms.setdefault(room, set()).add(session)
+
+    def close(self, session):
+        if session.room is not None:
+            self.rooms[session.room].discard(session)
+            if not self.rooms[session.room]:
+                del self.rooms[session.room]
+        del self.sessions[session.id]
+
+    def roll(self, room):
+        """Throw dices once for all sessions of room, push their diffs."""
+        red = self.rng.randint(1, 6)
+        yellow = self.rng.randint(0, 5)
+        for session in self.rooms.get(room, ()):
+            session.game.turn(red, yellow)
+            push = { 'id': session.id, 'push': True, 'diff': session.diff() }
+            if session.writer is not None:
+                session.writer.write(json.dumps(push).encode() + b'\n')
+        return { 'room': room, 'dices': [red, yellow] }
+
+    def dispatch(self, message, writer=None):
+        """Reply to a request."""
+        self.requests += 1
+        op = message.get('op')
+        if op == 'new':
+            return self.new(message, writer)
+        if op == 'roll':
+            return self.roll(message['room'])
+        session = self.sessions.get(message.get('id'))
+        if session is None:
+            raise ValueError(f'no session {message.get("id")!r}')
+        if op == 'join':
+            self.join(session, message['room'])
+            return { 'id': session.id }
+        if op == 'close':
+            self.close(session)
+            return { 'id': session.id }
+        return { 'id': session.id, 'diff': session.handle(message) }
+
+    async def serve_client(self, reader, writer):
+        owned = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = None
+                try:
+                    message = json.loads(line)
+                    reply = self.dispatch(message, writer)
+                    if message.get('op') == 'new':
+                        owned.append(reply['id'])
+                except Exception as e:
+                    # a bad request, or a board missing from the library
+                    reply = { 'error': str(e) or type(e).__name__ }
+                    if isinstance(message, dict) and 'id' in message:
+                        reply['id'] = message['id']
+                if isinstance(message, dict) and 'seq' in message:
+                    reply['seq'] = message['seq']
+                writer.write(json.dumps(reply).encode() + b'\n')
+                if writer.transport.get_write_buffer_size() > 1 << 16:
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # sessions end with their connection
+            for sid in owned:
+                if sid in self.sessions:
+                    self.close(self.sessions[sid])
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765, unix=None):
+        if unix is not None:
+            return await asyncio.start_unix_server(self.serve_client, unix, limit=1 << 20)
+        return await asyncio.start_server(self.serve_client, host, port, limit=1 << 20)
+
+
+async def serve(args):
+    server = Server(seed=args.seed)
+    listener = await server.start(args.host, args.port, args.unix)
+    # port 0 picks a free port
+    print('listening on', args.unix or '%s:%d' % listener.sockets[0].getsockname()[:2], flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='unix socket path, instead of TCP')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
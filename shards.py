@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+"""
+Session host sharded on worker processes.
+
+The board geometry is detected once and put in shared memory: counts,
+circles (x, y, r) and connections, in the board order, as unsigned
+shorts. Workers stay attached to the block and their games read the
+circles and connections through views on it, so the board is in memory
+once for all workers, and the neighbours built from it once per worker
+in model.adjacencies. Each session lives in worker id % workers and
+takes the requests of server.Session. Sessions idle for a while are
+evicted to a sync snapshot file of about a hundred bytes, and loaded
+again on their next request; a host on the same directory goes on with
+them, and closing a host evicts all its sessions.
+
+Requests go to the workers in batches, one list per worker, so workers
+handle their share of a batch in parallel.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from array import array
+from collections.abc import Sequence
+from multiprocessing import Pipe, Process, shared_memory
+
+import builder
+import server
+import sync
+
+
+def share_board(board):
+    """Shared memory block of a board."""
+    circles, cnxs = board
+    values = array('H', (len(circles), len(cnxs)))
+    for circle in circles:
+        values.extend(circle)
+    for cnx in cnxs:
+        values.extend(cnx)
+    shm = shared_memory.SharedMemory(create=True, size=values.itemsize*len(values))
+    shm.buf[:len(shm.buf)] = values.tobytes()
+    return shm
+
+class Rows(Sequence):
+    """
+    Tuples of width values of a memoryview, read on access. Hashed and
+    compared by value, to key model.adjacencies.
+    """
+    def __init__(self, values, width):
+        self.values = values
+        self.width = width
+        self.hash = None
+
+    def __len__(self):
+        return len(self.values) // self.width
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self[j] for j in range(len(self))[i] ]
+        i = range(len(self))[i]
+        return tuple(self.values[i*self.width:(i+1)*self.width])
+
+    def __eq__(self, other):
+        return self is other or tuple(self) == tuple(other)
+
+    def __hash__(self):
+        if self.hash is None:
+            self.hash = hash(tuple(self))
+        return self.hash
+
+# shared memory blocks attached by this process and their boards, kept
+# attached while the process runs
+attached = {}
+
+def attach_board(name):
+    """Board of a shared memory block, as views on the block."""
+    if name not in attached:
+        shm = shared_memory.SharedMemory(name)
+        values = shm.buf.cast('H')
+        n, m = values[0], values[1]
+        board = Rows(values[2:2+3*n], 3), Rows(values[2+3*n:2+3*n+2*m], 2)
+        attached[name] = shm, board
+    return attached[name][1]
+
+def snapshot_path(directory, sid):
+    """Snapshot file of an evicted session."""
+    return os.path.join(directory, f'{sid}.snap')
+
+def snapshot_ids(directory):
+    """Ids of the sessions evicted to directory."""
+    return [ int(name[:-5]) for name in os.listdir(directory)
+             if name.endswith('.snap') and name[:-5].isdigit() ]
+
+def rss():
+    """Resident memory of the process in bytes."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Worker:
+    """Sessions of a worker process, evicted to files when idle."""
+    def __init__(self, board, directory):
+        self.board = board
+        self.directory = directory
+        self.sessions = {}
+        self.used = {}
+        self.evicted = 0
+        self.loaded = 0
+
+    def session(self, sid):
+        session = self.sessions.get(sid)
+        if session is None:
+            path = snapshot_path(self.directory, sid)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                raise ValueError(f'no session {sid!r}') from None
+            session = self.sessions[sid] = server.Session(sid, self.board)
+            sync.load(session.game, data)
+            # the client already has this state
+            session.diff()
+            os.remove(path)
+            self.loaded += 1
+        self.used[sid] = time.monotonic()
+        return session
+
+    def evict(self, idle):
+        """Write sessions idle for idle seconds to files, return their count."""
+        limit = time.monotonic() - idle
+        idles = [ sid for sid, used in self.used.items() if used <= limit ]
+        for sid in idles:
+            with open(snapshot_path(self.directory, sid), 'wb') as f:
+                f.write(sync.encode_snapshot(self.sessions.pop(sid).game))
+            del self.used[sid]
+        self.evicted += len(idles)
+        return len(idles)
+
+    def stats(self):
+        return { 'sessions': len(self.sessions), 'evicted': self.evicted,
+                 'loaded': self.loaded, 'rss': rss() }
+
+    def handle(self, message):
+        op = message['op']
+        if op == 'new':
+            sid = message['id']
+            session = self.sessions[sid] = server.Session(sid, self.board)
+            self.used[sid] = time.monotonic()
+            return { 'id': sid, 'diff': session.state() }
+        if op == 'stats':
+            return self.stats()
+        if op == 'evict':
+            return { 'evicted': self.evict(message.get('idle', 0.)) }
+        session = self.session(message['id'])
+        if op == 'close':
+            del self.sessions[session.id]
+            del self.used[session.id]
+            return { 'id': session.id }
+        if op == 'state':
+            return { 'id': session.id, 'diff': session.state() }
+        return { 'id': session.id, 'diff': session.handle(message) }
+
+def work(connection, name, directory, idle, sweep):
+    """Worker process: handle batches until None or the end of the pipe."""
+    worker = Worker(attach_board(name), directory)
+    next_sweep = time.monotonic() + sweep
+    while True:
+        if idle is not None and time.monotonic() >= next_sweep:
+            worker.evict(idle)
+            next_sweep = time.monotonic() + sweep
+        if not connection.poll(sweep):
+            continue
+        try:
+            messages = connection.recv()
+        except EOFError:
+            break
+        if messages is None:
+            break
+        replies = []
+        for message in messages:
+            try:
+                replies.append(worker.handle(message))
+            except Exception as e:
+                # an error reply, the batch and the worker go on
+                replies.append({ 'error': str(e) or type(e).__name__ })
+        connection.send(replies)
+
+
+class Host:
+    """
+    Worker processes sharing a board, sessions routed by id.
+    Sessions idle for idle seconds are evicted, None to keep them.
+    New ids follow those of the sessions evicted to directory.
+    """
+    def __init__(self, board=None, workers=None, directory='sessions', idle=60., sweep=1.):
+        self.shm = share_board(builder.load_board(board))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.connections = []
+        self.processes = []
+        for _ in range(workers or os.cpu_count()):
+            connection, child = Pipe()
+            process = Process(target=work, args=(child, self.shm.name, directory, idle, sweep),
+                              daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+        self.next_id = max(snapshot_ids(directory), default=-1) + 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def route(self, message):
+        sid = message.get('id')
+        if not isinstance(sid, int):
+            raise ValueError(f'no session id in {message!r}')
+        return sid % len(self.connections)
+
+    def requests(self, messages):
+        """Replies of messages, in order."""
+        batches = [ [] for _ in self.connections ]
+        order = []
+        for message in messages:
+            if message.get('op') == 'new':
+                message = dict(message, id=self.next_id)
+                self.next_id += 1
+            worker = self.route(message)
+            order.append((worker, len(batches[worker])))
+            batches[worker].append(message)
+        for connection, batch in zip(self.connections, batches):
+            if batch:
+                connection.send(batch)
+        replies = [ connection.recv() if batch else []
+                    for connection, batch in zip(self.connections, batches) ]
+        return [ replies[worker][i] for worker, i in order ]
+
+    def request(self, message):
+        return self.requests([message])[0]
+
+    def broadcast(self, message):
+        """Reply of each worker to message."""
+        for connection in self.connections:
+            connection.send([message])
+        return [ connection.recv()[0] for connection in self.connections ]
+
+    def stats(self):
+        return self.broadcast({ 'op': 'stats' })
+
+    def evict(self, idle=0.):
+        return sum(reply['evicted'] for reply in self.broadcast({ 'op': 'evict', 'idle': idle }))
+
+    def close(self):
+        """Evict all sessions and stop the workers."""
+        if not self.connections:
+            return
+        self.evict()
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+        self.shm.close()
+        self.shm.unlink()
+
+
+def run(workers=None, sessions=10000, rounds=5, directory=None, board=None, seed=0):
+    """
+    Create sessions on a new host and play random rounds of check,
+    choose and turn, then evict them all. Return requests per second,
+    memory and snapshot file bytes per session.
+    """
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp, \
+            Host(board, workers, directory or tmp, idle=None) as host:
+        before = sum(stats['rss'] for stats in host.stats())
+        replies = host.requests([ { 'op': 'new' } ]*sessions)
+        memory = (sum(stats['rss'] for stats in host.stats()) - before)/sessions
+        empty = { reply['id']: { num for num, value, _ in reply['diff']['circles'] if value is None }
+                  for reply in replies }
+        requests = 0
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for op in ('check', 'choose', 'turn'):
+                messages = []
+                for sid, nums in empty.items():
+                    if op == 'check':
+                        messages.append({ 'op': op, 'id': sid, 'pair': rng.randrange(5) })
+                    elif op == 'choose' and nums:
+                        messages.append({ 'op': op, 'id': sid, 'circle': rng.choice(list(nums)) })
+                    elif op == 'turn':
+                        messages.append({ 'op': op, 'id': sid })
+                for message, reply in zip(messages, host.requests(messages)):
+                    for num, value, _ in reply['diff'].get('circles', ()):
+                        if value is not None:
+                            empty[message['id']].discard(num)
+                requests += len(messages)
+        elapsed = time.perf_counter() - start
+        evicted = host.evict()
+        snapshot = sum(os.path.getsize(snapshot_path(host.directory, sid)) for sid in empty)/evicted
+    return requests/elapsed, memory, snapshot
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the session host from 1 to all cores.')
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='most workers')
+    args = parser.parse_args()
+    print(f'{"workers":>7} {"requests/s":>10} {"speedup":>7} {"bytes/session":>13} {"snapshot":>8}')
+    single = None
+    for workers in range(1, args.workers+1):
+        speed, memory, snapshot = run(workers, args.sessions, args.rounds)
+        single = single or speed
+        print(f'{workers:7} {speed:10.0f} {speed/single:7.2f} {memory:13.0f} {snapshot:8.0f}')
+
+if __name__ == "__main__":
+    main()
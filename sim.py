@@ -0,0 +1,274 @@
+"""
+Headless game engine for simulations.
+
+Same rules and scores as model.Game, without events nor objects per
+circle: board values live in arrays, adjacency is precomputed and
+choices are a bit mask with 4 bits per pair.
+"""
+
+import random
+from array import array
+
+import builder
+import model
+
+
+EMPTY = -1
+
+ROLLS = tuple((red, yellow) for red in range(1, 7) for yellow in range(0, 6))
+
+PAIR_LIST = tuple(model.Pair)
+
+# number of checked choices for each 4 bits value
+COUNTS = [ bin(bits).count('1') for bits in range(16) ]
+
+
+class Sim:
+    def __init__(self, board=None, seed=None):
+        board = builder.load_board(board)
+        circles, cnxs = board
+        count = len(circles)
+        neighbours = [ [] for _ in range(count) ]
+        for i, j in cnxs:
+            neighbours[i].append(j)
+        self.neighbours = tuple(tuple(nums) for nums in neighbours)
+        self.max_count = model.Choices().max_count()
+        bonus = model.Score()
+        self.bonus = [ bonus.bonus_for(size) for size in range(count+1) ]
+        self.rng = random.Random(seed)
+        self.rolls = None
+        self.reset()
+
+    def reset(self):
+        count = len(self.neighbours)
+        self.values = array('b', [EMPTY])*count
+        self.empty = list(range(count))
+        self.choices = 0
+        self.open_pairs = PAIR_LIST
+        self.red = None
+        self.yellow = None
+        self.pairs = None
+        # maps: disjoint-set of connected circles with the same value
+        self.parent = array('h', range(count))
+        self.size = array('h', [1])*count
+        self.low = array('h', range(count))
+        self.groups = set()
+        self.max_size = 0
+        # paths: disjoint-set of linked circles, EMPTY if not in a path
+        self.path_parent = array('h', [EMPTY])*count
+        self.path_size = array('h', [0])*count
+        self.path_top = array('b', [EMPTY])*count
+        self.path_order = [0]*count
+        self.path_serial = 0
+        self.paths = set()
+
+    @classmethod
+    def from_game(cls, game):
+        """Engine in the same state as a model.Game."""
+        circles = game.circles.circles
+        cnxs = [ (circle.num, other) for circle in circles for other in circle.cnxs ]
+        sim = cls((circles, cnxs))
+        for pair in model.Pair:
+            count = min(game.choices.count(pair), sim.max_count)
+            sim.choices |= ((1 << count)-1) << 4*pair
+        sim.open_pairs = tuple(pair for pair in PAIR_LIST if sim.count(pair) < sim.max_count)
+        for circle in circles:
+            if circle.value is not None:
+                sim.values[circle.num] = circle.value
+                sim.empty.remove(circle.num)
+        for num, value in enumerate(sim.values):
+            for other in sim.neighbours[num]:
+                if value != EMPTY and sim.values[other] == value:
+                    sim.union(num, other)
+        for path in game.paths.paths:
+            root = path.circles[0].num
+            for circle in path.circles:
+                sim.path_parent[circle.num] = root
+            sim.path_size[root] = len(path)
+            sim.path_top[root] = EMPTY if path.top.value is None else path.top.value
+            sim.path_order[root] = sim.path_serial
+            sim.path_serial += 1
+            sim.paths.add(root)
+        if game.dices.red.value is not None:
+            sim.roll(game.dices.red.value, game.dices.yellow.value)
+        return sim
+
+    def copy(self):
+        other = Sim.__new__(Sim)
+        other.__dict__.update(self.__dict__)
+        for name in ('values', 'parent', 'size', 'low',
+                     'path_parent', 'path_size', 'path_top'):
+            setattr(other, name, getattr(self, name)[:])
+        other.empty = list(self.empty)
+        other.groups = set(self.groups)
+        other.path_order = list(self.path_order)
+        other.paths = set(self.paths)
+        return other
+
+    def roll(self, red, yellow):
+        self.red = red
+        self.yellow = yellow
+        self.pairs = model.PAIR_TABLE[red-1][yellow]
+
+    def use_rolls(self, red, yellow):
+        """Next throws read these dice values instead of the random generator."""
+        self.rolls = zip(red, yellow)
+
+    def throw(self):
+        if self.rolls is not None:
+            self.roll(*next(self.rolls))
+        else:
+            self.roll(*ROLLS[int(self.rng.random()*len(ROLLS))])
+
+    def count(self, pair):
+        return COUNTS[(self.choices >> 4*pair) & 0xF]
+
+    def legal_moves(self):
+        """Available (pair, circle) for the current roll."""
+        return [ (pair, num) for num in self.empty for pair in self.open_pairs ]
+
+    def done(self):
+        return not self.empty or not self.open_pairs
+
+    def step(self, pair, num):
+        """Check pair and set its value in circle num, then throw dices."""
+        self.place(pair, num)
+        self.throw()
+
+    def place(self, pair, num):
+        count = self.count(pair)
+        if count >= self.max_count:
+            raise ValueError(f'no choice left for {pair!r}')
+        if self.values[num] != EMPTY:
+            raise ValueError(f'circle {num} already filled')
+        self.choices |= 1 << (4*pair + count)
+        if count+1 == self.max_count:
+            self.open_pairs = tuple(other for other in self.open_pairs if other != pair)
+        value = self.pairs[pair]
+        self.values[num] = value
+        self.empty.remove(num)
+        # an empty circle linked before raises the top of its path
+        root = self.path_find(num)
+        if root != EMPTY:
+            self.path_top[root] = max(self.path_top[root], value)
+        for other in self.neighbours[num]:
+            if self.values[other] == value:
+                self.union(num, other)
+
+    def find(self, num):
+        parent = self.parent
+        while parent[num] != num:
+            parent[num] = parent[parent[num]]
+            num = parent[num]
+        return num
+
+    def union(self, num1, num2):
+        root1 = self.find(num1)
+        root2 = self.find(num2)
+        if root1 == root2:
+            return
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+        self.low[root1] = min(self.low[root1], self.low[root2])
+        self.groups.discard(root2)
+        self.groups.add(root1)
+        self.max_size = max(self.max_size, self.size[root1])
+
+    def path_find(self, num):
+        parent = self.path_parent
+        if parent[num] == EMPTY:
+            return EMPTY
+        while parent[num] != num:
+            parent[num] = parent[parent[num]]
+            num = parent[num]
+        return num
+
+    def path_join(self, root, num):
+        self.path_parent[num] = root
+        self.path_size[root] += 1
+        self.path_top[root] = max(self.path_top[root], self.values[num])
+
+    def link(self, new_num, num):
+        """Add path between 2 circles, like model.Paths.add."""
+        existing = self.path_find(new_num)
+        root = self.path_find(num)
+        if new_num == num:
+            # not a segment
+            pass
+        elif root != EMPTY:
+            if existing == EMPTY:
+                self.path_join(root, new_num)
+            elif existing != root:
+                # merge the smaller path in the bigger one
+                if self.path_size[existing] < self.path_size[root]:
+                    existing, root = root, existing
+                self.path_parent[root] = existing
+                self.path_size[existing] += self.path_size[root]
+                self.path_top[existing] = max(self.path_top[existing], self.path_top[root])
+                self.paths.discard(root)
+        elif existing != EMPTY:
+            self.path_join(existing, num)
+        else:
+            self.path_parent[new_num] = new_num
+            self.path_size[new_num] = 1
+            self.path_top[new_num] = self.values[new_num]
+            self.path_join(new_num, num)
+            self.path_order[new_num] = self.path_serial
+            self.path_serial += 1
+            self.paths.add(new_num)
+
+    def map_score(self):
+        """Same as model.ScoreMap.score."""
+        maps = sorted((self.low[root], root) for root in self.groups)
+        points = [ self.values[root]+self.size[root]-1 for _,root in maps ]
+        bonus = self.bonus[self.max_size]
+        return points, bonus, sum(points)+bonus
+
+    def path_score(self):
+        """Same as model.ScorePath.score."""
+        # paths of empty circles have no score yet
+        roots = sorted((root for root in self.paths if self.path_top[root] != EMPTY),
+                       key=lambda root: self.path_order[root])
+        if not roots:
+            return (), 0, 0
+        points = tuple(self.path_top[root]+self.path_size[root]-1 for root in roots)
+        bonus = self.bonus[max(self.path_size[root] for root in roots)]
+        return points, bonus, sum(points)+bonus
+
+
+# numpy array of model.PAIR_TABLE, made on first use
+pair_table = None
+
+def throw_batch(count, generator, turns=None):
+    """
+    Draw count rolls at once with a numpy Generator, or (count, turns)
+    rolls if turns is given. Return red and yellow values and the pair
+    values, with one more dimension of size 5.
+    """
+    global pair_table
+    import numpy as np
+    if pair_table is None:
+        pair_table = np.asarray(model.PAIR_TABLE, dtype=np.int8)
+    shape = count if turns is None else (count, turns)
+    red = generator.integers(1, 7, shape, dtype=np.int8)
+    yellow = generator.integers(0, 6, shape, dtype=np.int8)
+    return red, yellow, pair_table[red-1, yellow]
+
+def play(sim, rng, link=0.5):
+    """
+    Play a game with random moves, link new circles to a filled
+    neighbour with probability link. Return map and path totals.
+    """
+    sim.reset()
+    sim.throw()
+    while not sim.done():
+        pair = rng.choice(sim.open_pairs)
+        num = rng.choice(sim.empty)
+        sim.step(pair, num)
+        if rng.random() < link:
+            filled = [ other for other in sim.neighbours[num] if sim.values[other] != EMPTY ]
+            if filled:
+                sim.link(num, rng.choice(filled))
+    return sim.map_score()[2], sim.path_score()[2]
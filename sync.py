@@ -0,0 +1,118 @@
+"""
+Binary encoding of game deltas and snapshots, for network sync and
+saved games.
+
+Each delta is a code byte and its fields as bytes, NONE for None:
+3 bytes for most of them. A snapshot is a Restore delta: code, length
+as a little-endian short and the Game.snapshot bytes. A saved game is
+a snapshot followed by deltas, and is loaded by restoring its last
+snapshot and applying the deltas after it.
+"""
+
+import struct
+
+import model
+from model import NONE
+
+
+# delta types by code, Restore is the last one
+KINDS = (model.CircleValue, model.CircleMapped, model.PathAdd, model.ChoiceCheck,
+         model.DicesValue, model.Selection, model.Restore)
+CODES = { kind: code for code, kind in enumerate(KINDS) }
+RESTORE = CODES[model.Restore]
+LENGTH = struct.Struct('<H')
+
+
+def field(value):
+    return NONE if value is None else value
+
+def encode(deltas):
+    """Bytes of a list of deltas."""
+    data = bytearray()
+    for delta in deltas:
+        code = CODES[type(delta)]
+        if code == RESTORE:
+            data.append(code)
+            data += LENGTH.pack(len(delta.snapshot))
+            data += delta.snapshot
+        else:
+            data.append(code)
+            data.extend(field(value) for value in delta)
+    return bytes(data)
+
+def decode(data):
+    """Deltas of encoded bytes."""
+    deltas = []
+    i = 0
+    while i < len(data):
+        code = data[i]
+        if code == RESTORE:
+            length, = LENGTH.unpack_from(data, i+1)
+            deltas.append(model.Restore(bytes(data[i+3:i+3+length])))
+            i += 3 + length
+            continue
+        kind = KINDS[code]
+        size = len(kind._fields)
+        fields = [ None if byte == NONE else byte for byte in data[i+1:i+1+size] ]
+        if kind is model.CircleMapped:
+            fields[1] = bool(fields[1])
+        elif kind is model.ChoiceCheck:
+            fields[0] = model.Pair(fields[0])
+        deltas.append(kind(*fields))
+        i += 1 + size
+    return deltas
+
+def encode_snapshot(game):
+    return encode([ model.Restore(game.snapshot()) ])
+
+def apply(game, delta):
+    """Make the change of delta on game, sending its events."""
+    kind = type(delta)
+    circles = game.circles
+    if kind is model.CircleValue:
+        circles[delta.num].value = delta.value
+    elif kind is model.CircleMapped:
+        circles[delta.num].mapped = delta.mapped
+    elif kind is model.PathAdd:
+        game.paths.add(circles[delta.new], circles[delta.num])
+    elif kind is model.ChoiceCheck:
+        game.choices.check(delta.pair)
+    elif kind is model.DicesValue:
+        game.dices.set(delta.red, delta.yellow)
+    elif kind is model.Selection:
+        game.circle = None if delta.num is None else circles[delta.num]
+        game.value = delta.value
+        game.selected()
+    elif kind is model.Restore:
+        game.restore(delta.snapshot)
+    else:
+        raise ValueError(f'unknown delta {delta!r}')
+
+def load(game, data):
+    """Restore game from its last snapshot in data and the deltas after it."""
+    deltas = decode(data)
+    start = max((i for i, delta in enumerate(deltas) if type(delta) is model.Restore), default=0)
+    with model.EventSource.batch():
+        for delta in deltas[start:]:
+            apply(game, delta)
+
+
+class Tracker:
+    """Deltas of a game since the last flush."""
+    def __init__(self, game):
+        self.game = game
+        self.deltas = []
+        sources = [ game, game.dices, game.choices, game.paths ] + game.circles.circles
+        for source in sources:
+            source.subscribe('delta', self.deltas.append)
+
+    def snapshot(self):
+        """Full state, replacing the pending deltas."""
+        self.deltas.clear()
+        return encode_snapshot(self.game)
+
+    def flush(self):
+        """Bytes of the pending deltas."""
+        data = encode(self.deltas)
+        self.deltas.clear()
+        return data
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# modules and board images are at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,170 @@
+"""
+Helpers shared by the tests and bench.py: generated boards, games and window clicks,
+and reference implementations of what the fast code replaces.
+"""
+
+import random
+
+
+IMPORT_BUDGET = 0.05 # in seconds
+
+IMPORT_CHECK = """
+import sys, time
+start = time.perf_counter()
+import model
+elapsed = time.perf_counter() - start
+heavy = [ name for name in ('cv2', 'numpy', 'pygame') if name in sys.modules ]
+import ihm
+print(elapsed, ','.join(heavy), ihm.pygame.display.get_init(), model.game is None, sep='|')
+"""
+
+
+def lattice(n, r=31, seed=0):
+    """n circles on a jittered hexagonal lattice, spaced like the board."""
+    rng = random.Random(seed)
+    step = 2*r+4
+    cols = max(1, int(n**0.5))
+    circles = []
+    for i in range(n):
+        row, col = divmod(i, cols)
+        x = col*step + (step//2 if row % 2 else 0) + rng.randint(-2, 2)
+        y = row*(step*87//100) + rng.randint(-2, 2)
+        circles.append((x+r, y+r, r))
+    return circles
+
+def reference_map_score(score_map):
+    """ScoreMap.score before the disjoint-set, rebuilding maps on each call."""
+    maps = []
+    for circle in score_map.circles.circles:
+        if circle.value is None:
+            continue
+        first_map = None
+        for amap in maps:
+            if circle.value == amap['value']:
+                for other in amap['list']:
+                    if other.is_connected(circle.num):
+                        if first_map is None:
+                            amap['list'].append(circle)
+                            first_map = amap
+                        else:
+                            first_map['list'] += amap['list']
+                            maps.remove(amap)
+                        break
+        if first_map is None:
+            maps.append({ 'value': circle.value, 'list':[ circle ] })
+    points = []
+    max_size = 0
+    for amap in maps:
+        size = len(amap['list'])
+        if size<=1:
+            continue
+        points.append(amap['value']+size-1)
+        max_size = max(max_size, size)
+    bonus = score_map.bonus_for(max_size)
+    return points, bonus, sum(points)+bonus
+
+def random_boards(board, count, seed=0):
+    """Circles filled in random order with random values, some overwritten."""
+    import model
+    rng = random.Random(seed)
+    for _ in range(count):
+        circles = model.Circles(board)
+        score_map = model.ScoreMap(circles)
+        top = rng.randint(1, 6)
+        nums = rng.sample(range(len(circles.circles)), rng.randint(0, len(circles.circles)))
+        for num in nums:
+            circles[num].value = rng.randint(0, top)
+        if nums and rng.random() < 0.2:
+            circles[rng.choice(nums)].value = rng.randint(0, top)
+        yield score_map
+
+def play_game(game, rng, sim=None, link=0.5):
+    """
+    Play random moves on a model.Game, mirrored on sim if given.
+    Return map and path totals.
+    """
+    import model
+    while True:
+        red, yellow = game.dices.red.value, game.dices.yellow.value
+        pairs = [ pair for pair in model.Pair if game.choices.count(pair) < game.choices.max_count() ]
+        empty = [ circle.num for circle in game.circles.circles if circle.value is None ]
+        if not pairs or not empty:
+            break
+        pair = rng.choice(pairs)
+        num = rng.choice(empty)
+        game.check(pair)
+        game.choose(num)
+        if sim is not None:
+            sim.roll(red, yellow)
+            sim.place(pair, num)
+        if rng.random() < link:
+            filled = [ other for other in game.circles[num].cnxs if game.circles[other].value is not None ]
+            if filled:
+                other = rng.choice(filled)
+                game.choose(other)
+                if sim is not None:
+                    sim.link(num, other)
+        game.turn()
+    return game.score_maps.score()[2], game.score_path.score()[2]
+
+def random_actions(game, rng, count=60):
+    """Any turn, check and choose calls, even the ones a player would not do."""
+    import model
+    for _ in range(count):
+        action = rng.random()
+        if action < 0.2:
+            game.turn()
+        elif action < 0.5:
+            game.check(rng.choice(list(model.Pair)))
+        else:
+            game.choose(rng.randrange(len(game.circles.circles)))
+
+def record_games(filename, board, games=60):
+    """
+    Play games recorded in a new log, some of them not ended.
+    Return their snapshot and scores by game number.
+    """
+    import gamelog
+    import model
+    rng = random.Random(0)
+    random.seed(0)
+    expected = {}
+    with gamelog.Recorder(filename, board) as recorder:
+        for i in range(games):
+            game = model.Game(board, log=recorder)
+            if i % 10:
+                play_game(game, rng)
+            else:
+                random_actions(game, rng)
+            expected[game.log_game] = (game.snapshot(), game.score_maps.score(), game.score_path.score())
+            if i % 3:
+                # games not ended are replayed at the end of file
+                recorder.end(game.log_game)
+    return expected
+
+def random_clicks(window, count, seed=0):
+    """Clicks on dices, choices and circles like a player would do."""
+    import model
+    rng = random.Random(seed)
+    choices = window.choices
+    for _ in range(count):
+        yield window.dices.red.rect.center
+        pair = rng.choice(list(model.Pair))
+        n = min(choices.model.count(pair), choices.model.max_count()-1)
+        yield choices.rotate(n+0.5, pair+0.5)
+        yield rng.choice(window.circles.circles).center
+        if rng.random() < 0.5:
+            yield rng.choice(window.circles.circles).center
+
+def collide_hits(window, pos, choices=True):
+    """(widget, id) of the widgets whose collide function takes pos."""
+    hits = []
+    circle = window.circles.collide(pos)
+    if circle is not None:
+        hits.append((window.circles, circle))
+    pair = window.choices.collide(pos) if choices else None
+    if pair is not None:
+        hits.append((window.choices, pair))
+    if window.dices.collide(pos):
+        hits.append((window.dices, None))
+    return hits
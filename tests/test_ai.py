@@ -0,0 +1,19 @@
+import ai
+import builder
+import sim
+
+
+def test_table_is_not_reused_across_path_changes():
+    state = sim.Sim(builder.load_board(None), seed=1)
+    state.throw()
+    first = 0
+    second = state.neighbours[first][0]
+    for num in (first, second):
+        state.step(state.open_pairs[0], num)
+    advisor = ai.Advisor(budget=60., max_depth=2)
+    advisor.best(state)
+    state.link(second, first)
+    advisor.best(state)
+    fresh = ai.Advisor(budget=60., max_depth=2)
+    fresh.best(state)
+    assert advisor.table == fresh.table
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import builder
+import helpers
+
+
+def detections(monkeypatch):
+    """Count of the board detections of get_board."""
+    calls = []
+    get_circles = builder.get_circles
+    def counted(*args):
+        calls.append(args)
+        return get_circles(*args)
+    monkeypatch.setattr(builder, 'get_circles', counted)
+    return calls
+
+def load(filename, hough=builder.HOUGH):
+    # a new process: only the cache file is left
+    builder.boards.clear()
+    return builder.get_board(filename, hough)
+
+def test_cache_is_rebuilt_only_when_image_or_parameters_change(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'board.jpg')
+    shutil.copy('dunai.jpg', filename)
+    calls = detections(monkeypatch)
+    board = load(filename)
+    assert len(calls) == 1 and os.path.exists(filename + '.board')
+    assert load(filename) == board and len(calls) == 1
+    # same content with a new date: checked by content key, not detected again
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load(filename) == board and len(calls) == 1
+    # other parameters or other content are detected again
+    load(filename, builder.HOUGH[:-1] + (builder.HOUGH[-1]+1,))
+    assert len(calls) == 2
+    with open(filename, 'ab') as f:
+        f.write(b'\0')
+    assert load(filename) == board and len(calls) == 3
+
+def test_get_board_is_shared_in_process(monkeypatch):
+    builder.boards.clear()
+    board = builder.get_board()
+    calls = detections(monkeypatch)
+    assert builder.get_board() is board and not calls
+
+def test_fast_connections_are_the_loop_pairs():
+    boards = [ builder.get_board()[0], helpers.lattice(19), helpers.lattice(1000, seed=1) ]
+    for circles in boards:
+        expected = builder.get_connections(circles)
+        assert builder.get_connections_fast(circles) == expected
+        # grid index of large boards
+        assert builder.get_connections_fast(circles, dense_max=0) == expected
+        indptr, indices = builder.get_connections_fast(circles, True)
+        assert [ (i, int(j)) for i in range(len(circles))
+                 for j in indices[indptr[i]:indptr[i+1]] ] == expected
+
+def test_board_uses_fast_connections(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'board.jpg')
+    shutil.copy('dunai.jpg', filename)
+    monkeypatch.setattr(builder, 'get_connections', None)
+    circles, cnxs = load(filename)
+    assert cnxs == builder.get_connections_fast(circles)
@@ -0,0 +1,25 @@
+import model
+
+
+def counted(source, event='update'):
+    calls = []
+    source.subscribe(event, lambda: calls.append(event))
+    return calls
+
+def test_batch_of_a_subclass_delays_and_merges_events():
+    game = model.Game()
+    calls = counted(game.paths)
+    with model.Game.batch():
+        game.paths.triggerEvent('update')
+        with model.Circle.batch():
+            game.paths.triggerEvent('update')
+        assert calls == []
+    assert calls == ['update']
+    assert model.EventSource.pending is None
+
+def test_dices_update_once_per_throw():
+    dices = model.Dices()
+    calls = counted(dices)
+    dices.throw()
+    dices.set(3, 2)
+    assert calls == ['update', 'update']
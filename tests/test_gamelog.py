@@ -0,0 +1,58 @@
+import pytest
+
+import builder
+import gamelog
+import model
+from helpers import record_games
+
+
+def test_reopened_log_continues_after_highest_game(tmp_path):
+    filename = str(tmp_path / 'games.log')
+    board = builder.get_board()
+    with gamelog.Recorder(filename, board) as recorder:
+        first = model.Game(board, log=recorder)
+        second = model.Game(board, log=recorder)
+        recorder.end(second.log_game)
+        # the last record ends the first game
+        first.check(model.Pair.Min)
+    with gamelog.Recorder(filename, board) as recorder:
+        assert recorder.start() == second.log_game+1
+
+def test_recorder_counts_circles_of_board(tmp_path):
+    filename = str(tmp_path / 'games.log')
+    with gamelog.Recorder(filename, builder.get_board()):
+        pass
+    circles, cnxs = builder.get_board()
+    with pytest.raises(ValueError):
+        gamelog.Recorder(filename, (circles[:-1], cnxs))
+
+def test_log_refuses_history(tmp_path):
+    with gamelog.Recorder(str(tmp_path / 'games.log')) as recorder:
+        with pytest.raises(ValueError):
+            model.Game(log=recorder, history=10)
+
+def test_replay_matches_the_recorded_games(tmp_path):
+    filename = str(tmp_path / 'games.log')
+    board = builder.get_board()
+    expected = record_games(filename, board)
+    log = gamelog.GameLog(filename, board)
+    replayed = { game: (state.snapshot(), state.map_score(), state.path_score())
+                 for game, state in log.replay() }
+    log.close()
+    assert replayed == expected
+
+def test_seek_with_any_checkpoint_interval(tmp_path):
+    filename = str(tmp_path / 'games.log')
+    board = builder.get_board()
+    record_games(filename, board, 4)
+    log = gamelog.GameLog(filename, board)
+    for game in range(4):
+        moves = log.moves(game)
+        state = gamelog.Replay(board)
+        for move in range(len(moves)+1):
+            for every in (1, 5, 16):
+                assert log.seek(game, move, every).snapshot() == state.snapshot(), (game, move, every)
+            if move < len(moves):
+                state.apply(*moves[move])
+    assert { every for _, every in log.checkpoints } == {1, 5, 16}
+    log.close()
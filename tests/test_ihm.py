@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+pygame = pytest.importorskip('pygame')
+
+import helpers
+import ihm
+import model
+
+
+def test_click_pushes_only_changed_rectangles(monkeypatch):
+    pygame.init()
+    window = ihm.Window(model.Game())
+    pushed = []
+    monkeypatch.setattr(pygame.display, 'update', pushed.extend)
+    monkeypatch.setattr(pygame.display, 'flip', None)
+    display = pygame.display.get_surface()
+    before = pygame.surfarray.array3d(display)
+    pos = window.choices.rotate(0.5, model.Pair.Max+0.5)
+    window.handle(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1))
+    changed = (pygame.surfarray.array3d(display) != before).any(axis=2)
+    covered = np.zeros_like(changed)
+    for rect in pushed:
+        covered[rect.left:rect.right, rect.top:rect.bottom] = True
+    assert changed.any() and not (changed & ~covered).any()
+    area = sum(rect.width*rect.height for rect in pushed)
+    assert area < window.size[0]*window.size[1]/10
+    stats = ihm.screen.stats()
+    assert stats['frames'] == 1 and stats['pixels'] == area
+    # a click on nothing pushes no frame
+    count = len(pushed)
+    assert window.hits.get((0, 0)) is None
+    window.handle(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=(0, 0), button=1))
+    assert ihm.screen.stats()['frames'] == 1 and len(pushed) == count
+
+def test_hit_map_matches_collide_functions():
+    pygame.init()
+    window = ihm.Window(model.Game())
+    choices = window.choices
+    # choices.collide is slow, only test it near the grid
+    xs, ys = zip(*[ point for pair in model.Pair for n in range(choices.model.max_count())
+                          for point in choices.get_pos(n, pair) ])
+    grid = pygame.Rect(int(min(xs))-1, int(min(ys))-1, int(max(xs)-min(xs))+3, int(max(ys)-min(ys))+3)
+    width, height = window.size
+    for y in range(-1, height+1):
+        for x in range(-1, width+1):
+            pos = (x, y)
+            hits = helpers.collide_hits(window, pos, grid.collidepoint(pos))
+            assert len(hits) <= 1, (pos, hits)
+            assert window.hits.get(pos) == (hits[0] if hits else None), pos
@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+import helpers
+
+
+def import_check():
+    out = subprocess.run([sys.executable, '-c', helpers.IMPORT_CHECK], check=True,
+                         capture_output=True, text=True).stdout
+    return out.splitlines()[-1].split('|')
+
+def test_import_has_no_side_effect():
+    _, heavy, display, lazy = import_check()
+    assert heavy == '', f'import model loads {heavy}'
+    assert display == 'False', 'import ihm opens the display'
+    assert lazy == 'True', 'import model creates a game'
+
+def test_import_budget():
+    best = min(float(import_check()[0]) for _ in range(5))
+    assert best < helpers.IMPORT_BUDGET, f'import model takes {best*1000:.1f} ms'
@@ -0,0 +1,22 @@
+import instrument
+import model
+
+
+def test_triggers_are_counted_before_batches_merge_them():
+    source = model.EventSource()
+    source.subscribe('update', lambda: None)
+    originals = dict(vars(model.EventSource))
+    instrument.reset()
+    instrument.enable()
+    try:
+        with model.EventSource.batch():
+            for _ in range(3):
+                source.triggerEvent('update')
+        source.triggerEvent('update')
+    finally:
+        instrument.disable()
+    counters = instrument.summary()
+    instrument.reset()
+    assert counters['trigger.update']['calls'] == 4
+    assert counters['event.update']['calls'] == 2
+    assert dict(vars(model.EventSource)) == originals
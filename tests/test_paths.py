@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+import gamelog
+import model
+import sim
+
+
+def linked_to_empty():
+    """Circle 3 linked to the empty circle 4, which gets 30 after."""
+    game = model.Game()
+    game.turn(1, 0)
+    game.check(model.Pair.Min)
+    game.choose(3)
+    game.choose(4)
+    game.turn(6, 5)
+    game.check(model.Pair.Mul)
+    game.choose(4)
+    return game
+
+def test_value_set_after_link_is_top():
+    game = linked_to_empty()
+    assert game.paths.paths[0].top.num == 4
+    assert game.score_path.score() == ((31,), 0, 31)
+
+def test_overwritten_value_changes_top():
+    game = linked_to_empty()
+    game.turn(1, 0)
+    game.check(model.Pair.Min)
+    game.choose(4)
+    assert game.score_path.score() == ((1,), 0, 1)
+    assert [ circle.num for circle in game.paths.paths[0].path ] == [3, 4]
+
+def test_replay_and_sim_match():
+    game = linked_to_empty()
+    replay = gamelog.Replay()
+    replay.play([ (gamelog.TURN, 1, 0), (gamelog.CHECK, model.Pair.Min, 0),
+                  (gamelog.CHOOSE, 3, 0), (gamelog.CHOOSE, 4, 0),
+                  (gamelog.TURN, 6, 5), (gamelog.CHECK, model.Pair.Mul, 0),
+                  (gamelog.CHOOSE, 4, 0) ])
+    assert replay.path_score() == game.score_path.score()
+    assert replay.snapshot() == game.snapshot()
+    engine = sim.Sim()
+    engine.roll(1, 0)
+    engine.place(model.Pair.Min, 3)
+    engine.link(3, 4)
+    engine.roll(6, 5)
+    engine.place(model.Pair.Mul, 4)
+    assert engine.path_score() == game.score_path.score()
+
+def test_restore_keeps_top():
+    game = linked_to_empty()
+    other = model.Game()
+    other.restore(game.snapshot())
+    assert other.score_path.score() == game.score_path.score()
+    assert other.snapshot() == game.snapshot()
+
+def test_top_is_kept_without_reading_the_path():
+    rng = random.Random(0)
+    # dices use the random module
+    random.seed(0)
+    game = model.Game()
+    for _ in range(300):
+        action = rng.random()
+        if action < 0.2:
+            game.turn()
+        elif action < 0.5:
+            game.check(rng.choice(list(model.Pair)))
+        else:
+            game.choose(rng.randrange(len(game.circles.circles)))
+        for path in game.paths.paths:
+            assert path.top is max(path.circles, key=model.value_key)
+    assert any(len(path) > 2 for path in game.paths.paths)
+
+def test_snapshot_of_other_format_is_refused():
+    game = model.Game()
+    with pytest.raises(ValueError):
+        game.restore(game.snapshot() + bytes(19))
+
+def test_paths_of_empty_circles_have_no_score():
+    game = model.Game()
+    game.turn(1, 0)
+    game.choose(3)
+    game.choose(4)
+    game.choose(5)
+    game.choose(4)
+    assert game.score_path.score() == ((), 0, 0)
+    assert sim.Sim.from_game(game).path_score() == ((), 0, 0)
+    engine = sim.Sim()
+    for num in range(4):
+        engine.link(num, num+1)
+    assert engine.path_score() == ((), 0, 0)
+    # an empty path gives no bonus to a short one
+    engine.roll(1, 0)
+    engine.place(model.Pair.Min, 10)
+    engine.link(10, 11)
+    assert engine.path_score() == ((1,), 0, 1)
@@ -0,0 +1,28 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+pygame = pytest.importorskip('pygame')
+
+import helpers
+import ihm
+import model
+import render
+
+
+def test_offscreen_render_is_the_window(tmp_path):
+    pygame.init()
+    window = ihm.Window(model.Game())
+    # the window draws changes over the last drawing: paths may be under circles
+    helpers.play_game(window.game, random.Random(0))
+    surface = render.Renderer().render(window.game)
+    display = pygame.display.get_surface()
+    differ = (pygame.surfarray.array3d(display) != pygame.surfarray.array3d(surface)).any(axis=2)
+    assert differ.mean() < 0.01
+    filenames, _ = render.export([ ('game', window.game.snapshot()) ], str(tmp_path), workers=1)
+    image = pygame.image.load(filenames[0])
+    assert image.get_size() == window.size
+    assert (pygame.surfarray.array3d(image) == pygame.surfarray.array3d(surface)).all()
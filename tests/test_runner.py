@@ -0,0 +1,14 @@
+import runner
+
+
+def totals(chunk):
+    maps, paths = runner.run(60, workers=1, seed=3, chunk=chunk)
+    return maps.histogram, paths.histogram
+
+def test_results_do_not_depend_on_chunk_size():
+    assert totals(7) == totals(60) == totals(1)
+
+def test_histogram_of_no_game(capsys):
+    maps, _ = runner.run(0, workers=1)
+    runner.print_histogram(maps)
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,16 @@
+import builder
+import helpers
+
+
+def test_score_matches_previous_algorithm():
+    for score_map in helpers.random_boards(builder.get_board(), 2000):
+        assert score_map.score() == helpers.reference_map_score(score_map)
+
+def test_overwritten_value_splits_group():
+    for score_map in helpers.random_boards(builder.get_board(), 200, seed=1):
+        circles = score_map.circles
+        for circle in circles.circles:
+            if circle.value is not None:
+                circle.value = (circle.value + 1) % 7
+                break
+        assert score_map.score() == helpers.reference_map_score(score_map)
@@ -0,0 +1,27 @@
+import asyncio
+import json
+
+import server
+
+
+async def requests(host, messages, path):
+    listener = await host.start(unix=path)
+    reader, writer = await asyncio.open_unix_connection(path, limit=1 << 20)
+    replies = []
+    for message in messages:
+        writer.write(json.dumps(message).encode() + b'\n')
+        replies.append(json.loads(await reader.readline()))
+    writer.close()
+    listener.close()
+    return replies
+
+def test_failed_requests_reply_an_error(tmp_path, monkeypatch):
+    host = server.Server(seed=0)
+    # no board library in this directory
+    monkeypatch.chdir(tmp_path)
+    replies = asyncio.run(requests(host, [ { 'op': 'new', 'board': 'x', 'seq': 1 },
+                                           { 'op': 'new', 'board': [[[0, 0, 1]], []], 'seq': 2 },
+                                           { 'op': 'new', 'seq': 3 } ], str(tmp_path / 'socket')))
+    assert [ reply['seq'] for reply in replies ] == [1, 2, 3]
+    assert 'error' in replies[0] and 'error' in replies[1]
+    assert 'diff' in replies[2]
@@ -0,0 +1,30 @@
+from array import array
+
+import builder
+import model
+import shards
+
+
+def test_games_on_board_views_share_the_adjacency():
+    circles, cnxs = builder.get_board()
+    values = array('H')
+    for row in circles + cnxs:
+        values.extend(row)
+    values = memoryview(values)
+    board = shards.Rows(values[:3*len(circles)], 3), shards.Rows(values[3*len(circles):], 2)
+    assert list(board[0]) == circles and list(board[1]) == cnxs
+    first, second = model.Game(board), model.Game(board)
+    assert first.circles.geometry is board[0]
+    assert first.circles.circles[0].cnxs is second.circles.circles[0].cnxs
+    assert first.circles.masks == model.Game().circles.masks
+
+def test_sessions_outlive_their_host(tmp_path):
+    with shards.Host(workers=2, directory=str(tmp_path), idle=None) as host:
+        ids = [ reply['id'] for reply in host.requests([ { 'op': 'new' } ]*4) ]
+        host.requests([ { 'op': 'turn', 'id': sid } for sid in ids ])
+        states = host.requests([ { 'op': 'state', 'id': sid } for sid in ids ])
+    # closing evicted every session
+    assert sorted(shards.snapshot_ids(str(tmp_path))) == ids
+    with shards.Host(workers=3, directory=str(tmp_path), idle=None) as host:
+        assert host.request({ 'op': 'new' })['id'] == max(ids) + 1
+        assert host.requests([ { 'op': 'state', 'id': sid } for sid in ids ]) == states
@@ -0,0 +1,48 @@
+import random
+
+import builder
+import model
+from helpers import play_game, random_actions
+
+
+def state(game):
+    return game.snapshot(), game.score_maps.score(), game.score_path.score()
+
+def test_snapshot_restores_the_same_state():
+    board = builder.get_board()
+    rng = random.Random(0)
+    random.seed(0)
+    for _ in range(50):
+        game = model.Game(board)
+        play_game(game, rng)
+        other = model.Game(board)
+        other.restore(game.snapshot())
+        assert state(other) == state(game)
+        # restore sends updates for what changed
+        other.restore(model.Game(board).snapshot())
+        assert all(circle.value is None for circle in other.circles.circles)
+        assert other.score_maps.score() == ([], 0, 0)
+
+def test_undo_goes_back_to_each_check_and_choose():
+    board = builder.get_board()
+    rng = random.Random(1)
+    random.seed(1)
+    for _ in range(20):
+        game = model.Game(board, history=1000)
+        states = []
+        for _ in range(40):
+            before = state(game)
+            random_actions(game, rng, 1)
+            if len(game.history) > len(states):
+                states.append(before)
+        while states:
+            assert game.undo()
+            assert state(game) == states.pop()
+        assert not game.undo()
+
+def test_history_keeps_the_last_snapshots():
+    game = model.Game(history=2)
+    for pair in model.Pair:
+        game.check(pair)
+    assert game.undo() and game.undo() and not game.undo()
+    assert game.choices.count(model.Pair.Min) == 1
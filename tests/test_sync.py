@@ -0,0 +1,33 @@
+import random
+
+import builder
+import helpers
+import model
+import sync
+
+
+def test_mirror_follows_flushed_deltas():
+    board = builder.get_board()
+    rng = random.Random(0)
+    random.seed(0)
+    deltas = []
+    for _ in range(20):
+        game = model.Game(board, history=4)
+        tracker = sync.Tracker(game)
+        saved = tracker.snapshot()
+        mirror = model.Game(board)
+        sync.load(mirror, saved)
+        for _ in range(10):
+            helpers.random_actions(game, rng, 6)
+            if rng.random() < 0.2:
+                game.undo()
+            deltas += tracker.deltas
+            data = tracker.flush()
+            saved += data
+            sync.load(mirror, data)
+            assert mirror.snapshot() == game.snapshot()
+        # a new client loads the snapshot and every delta since
+        loaded = model.Game(board)
+        sync.load(loaded, saved)
+        assert loaded.snapshot() == game.snapshot()
+    assert deltas and sync.decode(sync.encode(deltas)) == deltas
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Play strategies on the same seeded dice sequences and store their
+score distributions and move latencies in a numpy .npz file.
+
+Game i of every strategy uses the same dice, drawn from a generator
+seeded with (seed, i), so results are paired between strategies and
+between runs. Compare with a previous result file to catch strength or
+speed regressions.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import ai
+import builder
+import sim
+
+
+PERCENTILES = (50, 90, 99, 100)
+
+
+class Strategy:
+    """Chooses moves on a sim.Sim state."""
+    name = None
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def move(self, state):
+        """(pair, circle) for the current roll."""
+        raise NotImplementedError
+
+    def link(self, state, num):
+        """Circle to link with the circle just filled, None for no path."""
+        return None
+
+
+class RandomStrategy(Strategy):
+    name = 'random'
+
+    def move(self, state):
+        return self.rng.choice(state.open_pairs), self.rng.choice(state.empty)
+
+    def link(self, state, num):
+        filled = [ other for other in state.neighbours[num] if state.values[other] != sim.EMPTY ]
+        if filled and self.rng.random() < 0.5:
+            return self.rng.choice(filled)
+        return None
+
+
+class GreedyMap(Strategy):
+    """Best immediate ScoreMap gain."""
+    name = 'greedy-map'
+
+    def __init__(self, seed=0):
+        super().__init__(seed)
+        self.advisor = ai.Advisor()
+
+    def move(self, state):
+        return max(state.legal_moves(),
+                   key=lambda move: self.advisor.gain(state, state.pairs[move[0]], move[1]))
+
+
+class GreedyPath(Strategy):
+    """Best immediate ScorePath total, linking to a filled neighbour."""
+    name = 'greedy-path'
+
+    def best_link(self, state, num):
+        best = (state.path_score()[2], None)
+        for other in state.neighbours[num]:
+            if state.values[other] == sim.EMPTY:
+                continue
+            linked = state.copy()
+            linked.link(num, other)
+            total = linked.path_score()[2]
+            if total > best[0]:
+                best = (total, other)
+        return best
+
+    def move(self, state):
+        best = (float('-inf'), None)
+        for pair, num in state.legal_moves():
+            placed = state.copy()
+            placed.place(pair, num)
+            total, _ = self.best_link(placed, num)
+            if total > best[0]:
+                best = (total, (pair, num))
+        return best[1]
+
+    def link(self, state, num):
+        return self.best_link(state, num)[1]
+
+
+class SearchStrategy(Strategy):
+    """Expectimax advisor."""
+    name = 'search'
+
+    def __init__(self, seed=0, budget=0.05):
+        super().__init__(seed)
+        self.advisor = ai.Advisor(budget=budget, seed=seed)
+
+    def move(self, state):
+        return self.advisor.best(state)
+
+
+STRATEGIES = { strategy.name: strategy for strategy in
+               (RandomStrategy, GreedyMap, GreedyPath, SearchStrategy) }
+
+
+def play(strategy, state):
+    """Play a game, return map total, path total and move latencies."""
+    latencies = []
+    state.throw()
+    while not state.done():
+        start = time.perf_counter()
+        pair, num = strategy.move(state)
+        state.place(pair, num)
+        other = strategy.link(state, num)
+        latencies.append(time.perf_counter() - start)
+        if other is not None:
+            state.link(num, other)
+        state.throw()
+    return state.map_score()[2], state.path_score()[2], latencies
+
+def run_games(args):
+    name, board, seed, start, stop, budget = args
+    options = { 'budget': budget } if name == SearchStrategy.name else {}
+    engine = sim.Sim(board)
+    turns = len(engine.neighbours)+1
+    scores = np.zeros((stop-start, 2), dtype=np.int32)
+    latencies = []
+    for index in range(start, stop):
+        strategy = STRATEGIES[name](seed=index, **options)
+        red, yellow, _ = sim.throw_batch(1, np.random.default_rng([seed, index]), turns)
+        engine.reset()
+        engine.use_rolls(red[0].tolist(), yellow[0].tolist())
+        map_total, path_total, game_latencies = play(strategy, engine)
+        scores[index-start] = map_total, path_total
+        latencies += game_latencies
+    return name, start, scores, np.array(latencies)
+
+def run(names, games, workers=None, seed=0, chunk=10, budget=0.05, board=None):
+    """Return scores (strategies, games, 2) and latency percentiles (strategies, PERCENTILES)."""
+    board = builder.load_board(board)
+    tasks = [ (name, board, seed, start, min(start+chunk, games), budget)
+              for name in names for start in range(0, games, chunk) ]
+    scores = np.zeros((len(names), games, 2), dtype=np.int32)
+    latencies = { name: [] for name in names }
+    with Pool(workers) as pool:
+        for name, start, chunk_scores, chunk_latencies in pool.imap_unordered(run_games, tasks):
+            scores[names.index(name), start:start+len(chunk_scores)] = chunk_scores
+            latencies[name].append(chunk_latencies)
+    percentiles = np.array([ np.percentile(np.concatenate(latencies[name]), PERCENTILES)
+                             for name in names ])
+    return scores, percentiles
+
+def save(filename, names, seed, scores, percentiles):
+    np.savez_compressed(filename, names=np.array(names), seed=seed, scores=scores,
+                        percentiles=np.array(PERCENTILES), latencies=percentiles)
+
+def report(names, scores, percentiles):
+    print(f'{"strategy":12} {"map":>7} {"path":>7} {"total":>7} {"std":>6} '
+          + ' '.join(f'{"p"+str(p)+" ms":>9}' for p in PERCENTILES))
+    for i, name in enumerate(names):
+        total = scores[i].sum(axis=1)
+        print(f'{name:12} {scores[i,:,0].mean():7.2f} {scores[i,:,1].mean():7.2f} '
+              f'{total.mean():7.2f} {total.std():6.2f} '
+              + ' '.join(f'{latency*1000:9.3f}' for latency in percentiles[i]))
+
+def compare(filename, names, scores, percentiles, score_drop=1., latency_factor=1.5):
+    """Compare with a previous result file, return the list of regressions."""
+    baseline = np.load(filename)
+    old_names = list(baseline['names'])
+    regressions = []
+    for i, name in enumerate(names):
+        if name not in old_names:
+            continue
+        j = old_names.index(name)
+        games = min(scores.shape[1], baseline['scores'].shape[1])
+        # same seeds, so games are paired
+        delta = scores[i,:games].sum(axis=1) - baseline['scores'][j,:games].sum(axis=1)
+        old_p99 = baseline['latencies'][j][PERCENTILES.index(99)]
+        new_p99 = percentiles[i][PERCENTILES.index(99)]
+        print(f'{name:12} score {delta.mean():+.2f} (paired std {delta.std():.2f}), '
+              f'p99 latency {old_p99*1000:.3f} -> {new_p99*1000:.3f} ms')
+        if delta.mean() < -score_drop:
+            regressions.append(f'{name}: score dropped by {-delta.mean():.2f}')
+        if new_p99 > latency_factor*old_p99:
+            regressions.append(f'{name}: p99 latency {new_p99/old_p99:.1f}x slower')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=float, default=0.05,
+                        help='search time per move, in seconds')
+    parser.add_argument('--output', default='tournament.npz')
+    parser.add_argument('--baseline', help='previous result file to compare with')
+    args = parser.parse_args()
+    scores, percentiles = run(args.strategies, args.games, args.workers, args.seed, budget=args.budget)
+    save(args.output, args.strategies, args.seed, scores, percentiles)
+    report(args.strategies, scores, percentiles)
+    if args.baseline:
+        regressions = compare(args.baseline, args.strategies, scores, percentiles)
+        for regression in regressions:
+            print('regression:', regression)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()